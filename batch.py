@@ -0,0 +1,125 @@
+#! /usr/bin/python
+
+#  Vectorized batch solver (needs NumPy)
+#
+#  N puzzles are stored as an (N, 81) array of uint16 candidate masks (the
+#  same masks as in bitboard.py). Naked and hidden singles are eliminated in
+#  every puzzle at once with array operations over index arrays built from
+#  Sudoku.regions. Only the puzzles that are still unsolved when the
+#  elimination gets stuck are handed to a per-puzzle engine for searching.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bitboard import ALL, BitBoard, POPCOUNT, DIGIT
+from sudoku import BOARD_SIZES, Sudoku, SudokuError
+
+def _index_arrays():
+    """ (27, 9) cell indices of the units, (81, 20) indices of the peers and
+    the (81, 3) unit / position in unit pairs of every cell """
+    units = [sorted(row*9+col for row, col in region)
+        for region in Sudoku.geometry(3)["regions"]]
+    peers = [sorted(set(j for unit in units if i in unit for j in unit) - set([i]))
+        for i in xrange(81)]
+    cell_units = [[u for u, unit in enumerate(units) if i in unit]
+        for i in xrange(81)]
+    cell_positions = [[units[u].index(i) for u in cell_units[i]]
+        for i in xrange(81)]
+    return (np.array(units), np.array(peers), np.array(cell_units),
+        np.array(cell_positions))
+
+_tables = None
+
+def tables():
+    """ lookup tables and index arrays, built on first use """
+    global _tables
+    if _tables is None:
+        if np is None:
+            raise SudokuError("The batch solver needs NumPy.")
+        popcount = np.array(POPCOUNT, dtype=np.uint8)
+        # character code of the digit of every mask, "0" if it isn't single
+        chars = np.array([ord(str(digit)) for digit in DIGIT], dtype=np.uint8)
+        _tables = (popcount, chars) + _index_arrays()
+    return _tables
+
+def to_masks(puzzles):
+    """ converts a list of 81 character puzzle strings to an (N, 81) array of
+    candidate masks, "0" (or any non digit) marks an empty cell """
+    digits = np.frombuffer("".join(puzzles), dtype=np.uint8).reshape(-1, 81)
+    digits = digits.astype(np.int16) - ord("0")
+    digits[(digits < 1) | (digits > 9)] = 0
+    masks = np.left_shift(1, np.maximum(digits - 1, 0)).astype(np.uint16)
+    masks[digits == 0] = ALL
+    return masks
+
+def to_strings(masks):
+    """ the inverse of to_masks(), unsolved cells are written as "0" """
+    chars = tables()[1]
+    buf = chars[masks].tostring()
+    return [buf[i:i+81] for i in xrange(0, len(buf), 81)]
+
+def eliminate(masks):
+    """ Eliminates naked and hidden singles in every row of masks until none
+    of them changes. Returns the new masks and a boolean array that flags
+    the inconsistent puzzles. """
+    popcount, chars, units, peers, cell_units, cell_positions = tables()
+    masks = masks.copy()
+    dead = np.zeros(len(masks), dtype=bool)
+    active = np.arange(len(masks)) # puzzles that might still change
+    while len(active):
+        current = masks[active]
+        single = popcount[current] == 1
+        # naked singles: remove the values of the single cells from the peers
+        values = np.where(single, current, 0)
+        taken = np.bitwise_or.reduce(values[:, peers], axis=2)
+        new = np.where(single, current, current & ~taken)
+        # hidden singles: digits that fit into only one cell of a unit
+        cells = new[:, units]
+        once = np.zeros(cells.shape[:2], dtype=np.uint16)
+        twice = np.zeros_like(once)
+        for k in xrange(9):
+            twice |= once & cells[:, :, k]
+            once |= cells[:, :, k]
+        hidden_units = cells & (once & ~twice)[:, :, np.newaxis]
+        hidden = (hidden_units[:, cell_units[:, 0], cell_positions[:, 0]] |
+            hidden_units[:, cell_units[:, 1], cell_positions[:, 1]] |
+            hidden_units[:, cell_units[:, 2], cell_positions[:, 2]])
+        new = np.where(hidden != 0, hidden, new)
+        # a cell without candidates, a cell that two digits need, or a digit
+        # without a place in some unit means the puzzle is inconsistent
+        counts = popcount[new]
+        broken = ((counts == 0).any(axis=1) | (popcount[hidden] > 1).any(axis=1)
+            | (once != ALL).any(axis=1))
+        changed = (new != current).any(axis=1) & ~broken
+        masks[active] = new
+        dead[active[broken]] = True
+        active = active[changed]
+    return masks, dead
+
+def solve_batch(puzzles, engine="bitmask"):
+    """ Solves a list of 81 character puzzle strings. Puzzles left unsolved
+    by eliminate() are finished one by one with Sudoku.solve(engine).
+    Returns a list of (solution string, solved) pairs in input order. """
+    if not puzzles:
+        return []
+    if any(BOARD_SIZES.get(len(puzzle), 3) != 3 for puzzle in puzzles):
+        raise SudokuError("The batch solver only takes 9x9 puzzles.")
+    popcount = tables()[0]
+    masks, dead = eliminate(to_masks(puzzles))
+    solved = (popcount[masks] == 1).all(axis=1) & ~dead
+    results = [(solution, True) for solution in to_strings(masks)]
+    for i in np.flatnonzero(~solved):
+        if dead[i]:
+            results[i] = (results[i][0], False)
+            continue
+        board = BitBoard(int(mask) for mask in masks[i])
+        if engine == "bitmask": # no need for a detour through Sudoku.table
+            found = board.solve()
+            results[i] = (board.to_str(), found)
+            continue
+        sudoku = Sudoku(indict=board.to_table())
+        found = sudoku.solve(engine)
+        results[i] = (sudoku.to_str(), found)
+    return results
@@ -0,0 +1,256 @@
+#! /usr/bin/python
+
+#  Benchmark runner for the sudoku solver
+#
+#  Solves the bundled puzzle sets with every engine, checks the results
+#  against the reference solutions and reports per puzzle latency
+#  percentiles and throughput. The report can be written as JSON and
+#  compared with a stored baseline:
+#
+#      ./benchmark.py --json run.json
+#      ./benchmark.py --compare benchmarks/baseline.json --threshold 0.25
+#
+#  The comparison exits with status 1 if any set/engine pair got slower than
+#  the baseline by more than the threshold, or if the time from importing
+#  sudoku.py to the first solution in a fresh interpreter is over
+#  STARTUP_BUDGET.
+#
+#  --scaling runs the SCALING_SETS instead, boards from 9x9 to 25x25, and
+#  shows how the mean solve time of every engine grows with the board.
+#  --heuristics compares the branching heuristics of the classic engine
+#  (see heuristics.py) on hard_95 by search nodes and time.
+
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+
+from sudoku import BOARD_SIZES, Sudoku, SudokuError
+
+BENCHMARK_SETS = [
+    ("euler_50", "puzzles/euler_puzzles_50.txt", "puzzles/euler_solutions_50.txt"),
+    ("hard_95", "puzzles/hard_puzzles_95.txt", "puzzles/hard_solutions_95.txt"),
+    ("hard_5", "puzzles/hard_puzzles_5.txt", "puzzles/hard_solutions_5.txt"),
+]
+# boards of growing size, see format_scaling()
+SCALING_SETS = [
+    ("9x9", "puzzles/euler_puzzles_50.txt", "puzzles/euler_solutions_50.txt"),
+    ("16x16", "puzzles/16x16_puzzles_10.txt", "puzzles/16x16_solutions_10.txt"),
+    ("25x25", "puzzles/25x25_puzzles_5.txt", "puzzles/25x25_solutions_5.txt"),
+]
+ENGINES = ["classic"] + sorted(Sudoku.engines)
+STARTUP_BUDGET = 0.05 # seconds from "import sudoku" to the first solution
+
+# run in a fresh interpreter by startup_time()
+STARTUP_CODE = """
+import time
+before = time.time()
+from sudoku import Sudoku
+Sudoku(instr={puzzle!r}).solve({engine!r})
+print time.time() - before
+"""
+
+def read_puzzles(path):
+    """ the 81 (256, 625) character lines of a puzzle (or solution) file """
+    with open(path) as infile:
+        return [line.strip() for line in infile if len(line.strip()) in BOARD_SIZES]
+
+def percentile(values, percent):
+    """ nearest rank percentile of a sorted list """
+    if not values:
+        return 0.0
+    rank = int(math.ceil(percent/100.0*len(values))) - 1
+    return values[min(max(rank, 0), len(values)-1)]
+
+def solve_timed(puzzle, engine):
+    """ Returns (solution string, wall seconds, cpu seconds) """
+    wall, cpu = time.time(), time.clock()
+    sudoku = Sudoku(instr=puzzle)
+    sudoku.solve(engine)
+    return sudoku.to_str(), time.time()-wall, time.clock()-cpu
+
+def startup_time(puzzle=None, engine="classic", repeat=3):
+    """ The best of repeat measurements of the time it takes a fresh
+    interpreter to import sudoku.py and solve a puzzle (the first one of
+    the first set by default). The start of the interpreter itself is not
+    included. """
+    if puzzle is None:
+        puzzle = read_puzzles(BENCHMARK_SETS[0][1])[0]
+    code = STARTUP_CODE.format(puzzle=puzzle, engine=engine)
+    return min(float(subprocess.check_output([sys.executable, "-c", code]))
+        for _ in xrange(repeat))
+
+def takes(engine, puzzle):
+    """ whether engine can solve boards of the size of puzzle """
+    try:
+        Sudoku(instr=puzzle).board(engine)
+    except SudokuError:
+        return False
+    return True
+
+def run_set(name, puzzles, solutions, engine, repeat=3, warmup=5):
+    """ Solves puzzles warmup times untimed (the first few of them), then
+    repeat times timed. Returns the statistics of the run as a dict; the
+    latencies are taken over every timed solve, "mismatches" lists the
+    (0 based) indices of the puzzles whose result differs from the
+    reference solution. """
+    for puzzle in puzzles[:warmup]:
+        solve_timed(puzzle, engine)
+    walls, cpus = [], []
+    mismatches = set()
+    for _ in xrange(repeat):
+        for i, puzzle in enumerate(puzzles):
+            solution, wall, cpu = solve_timed(puzzle, engine)
+            walls.append(wall)
+            cpus.append(cpu)
+            if solutions and solution != solutions[i]:
+                mismatches.add(i)
+    total = sum(walls)
+    walls.sort()
+    return {"set": name, "engine": engine, "puzzles": len(puzzles),
+        "repeat": repeat, "wall": total, "cpu": sum(cpus),
+        "mean": total/len(walls) if walls else 0.0,
+        "p50": percentile(walls, 50), "p95": percentile(walls, 95),
+        "p99": percentile(walls, 99),
+        "puzzles_per_sec": len(walls)/total if total else 0.0,
+        "mismatches": sorted(mismatches)}
+
+def run_benchmarks(sets=BENCHMARK_SETS, engines=ENGINES, repeat=3, warmup=5,
+        verbose=True):
+    """ Runs every set with every engine. Returns the report: a dict with
+    the environment and the list of run_set() results. """
+    results = []
+    for name, path_puzzle, path_solution in sets:
+        puzzles = read_puzzles(path_puzzle)
+        solutions = read_puzzles(path_solution) if path_solution else None
+        for engine in engines:
+            if engine != "classic" and not takes(engine, puzzles[0]):
+                continue
+            result = run_set(name, puzzles, solutions, engine, repeat, warmup)
+            if verbose: print format_result(result)
+            results.append(result)
+    startup = startup_time()
+    if verbose: print "startup: {:.4f}s".format(startup)
+    return {"python": platform.python_version(), "machine": platform.machine(),
+        "time": time.time(), "startup": startup, "results": results}
+
+def format_result(result):
+    return ("{set:>10} {engine:>8}: p50 {p50:.5f}s p95 {p95:.5f}s p99 {p99:.5f}s "
+        "{puzzles_per_sec:9.1f} puzzles/s cpu {cpu:.3f}s, {0!s} mismatches".format(
+        len(result["mismatches"]), **result))
+
+def run_heuristics(puzzles, selectors=None, orders=None, repeat=1):
+    """ Solves puzzles with the classic engine and every combination of
+    cell selector and value order (all of them by default). Returns a list
+    of dicts: the total number of search nodes (counted in a separate run
+    with a stats.SolveStats), the total and the median time per puzzle. """
+    from heuristics import CELL_SELECTORS, VALUE_ORDERS
+    from stats import SolveStats
+    results = []
+    for select in selectors or sorted(CELL_SELECTORS):
+        for order in orders or sorted(VALUE_ORDERS):
+            stats = SolveStats(count=0)
+            for puzzle in puzzles:
+                puzzle_stats = SolveStats()
+                Sudoku(instr=puzzle).solve(stats=puzzle_stats, select=select, order=order)
+                stats.add(puzzle_stats)
+            walls = []
+            for _ in xrange(repeat):
+                for puzzle in puzzles:
+                    before = time.time()
+                    Sudoku(instr=puzzle).solve(select=select, order=order)
+                    walls.append(time.time() - before)
+            walls.sort()
+            results.append({"select": select, "order": order,
+                "nodes": stats.nodes, "dead_ends": stats.dead_ends,
+                "wall": sum(walls)/repeat, "p50": percentile(walls, 50)})
+    return results
+
+def format_heuristics(results):
+    return "\n".join("{select:>7} {order:>9}: {nodes:6d} nodes {dead_ends:6d} "
+        "dead ends, {wall:7.3f}s, p50 {p50:.5f}s".format(**result)
+        for result in results)
+
+def format_scaling(report):
+    """ the mean solve time of every engine on every set of the report, and
+    how many times the time of the first set that is """
+    out = []
+    for engine in ENGINES:
+        results = [r for r in report["results"] if r["engine"] == engine]
+        if not results:
+            continue
+        first = results[0]["mean"]
+        out.append("{:>8}: ".format(engine) + ", ".join(
+            "{!s} {:.4f}s ({:.0f}x)".format(r["set"], r["mean"],
+                r["mean"]/first if first else 0.0)
+            for r in results))
+    return "\n".join(out)
+
+def compare(report, baseline, threshold=0.25):
+    """ Returns a list of regressions: set/engine pairs whose median latency
+    grew or whose throughput shrank by more than threshold (a fraction)
+    compared to the baseline report, pairs with wrong solutions, and a
+    startup time over STARTUP_BUDGET. """
+    old = dict(((r["set"], r["engine"]), r) for r in baseline["results"])
+    regressions = []
+    if report.get("startup", 0) > STARTUP_BUDGET:
+        regressions.append("startup: {:.4f}s, over the budget of {:.4f}s".format(
+            report["startup"], STARTUP_BUDGET))
+    for result in report["results"]:
+        key = (result["set"], result["engine"])
+        if result["mismatches"]:
+            regressions.append("{!s}/{!s}: {!s} wrong solutions".format(
+                key[0], key[1], len(result["mismatches"])))
+        if key not in old:
+            continue
+        before = old[key]
+        if result["p50"] > before["p50"]*(1+threshold):
+            regressions.append("{!s}/{!s}: p50 {:.5f}s -> {:.5f}s".format(
+                key[0], key[1], before["p50"], result["p50"]))
+        if result["puzzles_per_sec"] < before["puzzles_per_sec"]*(1-threshold):
+            regressions.append("{!s}/{!s}: {:.1f} -> {:.1f} puzzles/s".format(
+                key[0], key[1], before["puzzles_per_sec"], result["puzzles_per_sec"]))
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku solver benchmarks")
+    parser.add_argument("--sets", help="comma separated list of puzzle sets "
+        "(all of them by default)")
+    parser.add_argument("--scaling", action="store_true", help="run the "
+        "SCALING_SETS (9x9 to 25x25 boards) and show how the times grow")
+    parser.add_argument("--heuristics", action="store_true", help="compare "
+        "the branching heuristics of the classic engine on hard_95 instead")
+    parser.add_argument("--engines", default=",".join(ENGINES),
+        help="comma separated list of engines")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=5,
+        help="number of puzzles solved untimed before every run")
+    parser.add_argument("--json", metavar="FILE", help="write the report to FILE")
+    parser.add_argument("--compare", metavar="BASELINE",
+        help="fail if the run regressed compared to this report")
+    parser.add_argument("--threshold", type=float, default=0.25,
+        help="allowed slowdown for --compare, as a fraction")
+    args = parser.parse_args()
+    if args.heuristics:
+        print format_heuristics(run_heuristics(
+            read_puzzles("puzzles/hard_puzzles_95.txt"), repeat=args.repeat))
+        sys.exit()
+    sets = SCALING_SETS if args.scaling else BENCHMARK_SETS
+    if args.sets:
+        sets = [s for s in sets if s[0] in args.sets.split(",")]
+    report = run_benchmarks(sets, args.engines.split(","), args.repeat, args.warmup)
+    if args.scaling:
+        print format_scaling(report)
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(report, outfile, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(report, json.load(infile), args.threshold)
+        for regression in regressions:
+            print "REGRESSION {!s}".format(regression)
+        if regressions:
+            sys.exit(1)
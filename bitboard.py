@@ -0,0 +1,361 @@
+#! /usr/bin/python
+
+#  Bitmask board engine for the sudoku solver
+#
+#  Every cell is stored as a 9 bit candidate mask (bit k set <=> the digit k+1
+#  is still possible) in a flat list of 81 ints, indexed by row*9+col. The
+#  geometry (units and peers) is precomputed as lists of indices, so that the
+#  solver never has to build tuples or sets while it is working.
+
+from itertools import product
+
+ALL = 0x1ff # every digit is possible
+
+# lookup tables for all the 512 possible masks
+POPCOUNT = [bin(mask).count("1") for mask in xrange(512)]
+DIGIT = [0]*512 # digit represented by a single bit mask, 0 otherwise
+for _digit in xrange(1, 10):
+    DIGIT[1 << (_digit-1)] = _digit
+BITS = [tuple(1 << k for k in xrange(9) if mask >> k & 1) for mask in xrange(512)]
+
+def _initialize_geometry():
+    """ Build the unit and peer index lists. The units come in the same order
+    as Sudoku.regions: boxes first, then rows, then columns. """
+    projections = [range(3), range(3, 6), range(6, 9)]
+    boxes = [[row*9+col for row, col in product(x, y)]
+        for x, y in product(projections, projections)]
+    rows = [[row*9+col for col in xrange(9)] for row in xrange(9)]
+    cols = [[row*9+col for row in xrange(9)] for col in xrange(9)]
+    units = boxes + rows + cols
+    # box, row and column of every cell
+    cell_units = [[i // 27 * 3 + i % 9 // 3, 9 + i // 9, 18 + i % 9]
+        for i in xrange(81)]
+    peers = [sorted(set(units[u0] + units[u1] + units[u2]) - set([i]))
+        for i, (u0, u1, u2) in enumerate(cell_units)]
+    # every box meets 3 rows and 3 columns in a segment of 3 cells
+    intersections = []
+    unit_intersections = [[] for unit in units]
+    for b, box in enumerate(boxes):
+        for l in sorted(set(u for i in box for u in cell_units[i][1:])):
+            line = units[l]
+            segment = [i for i in box if cell_units[i][1] == l or cell_units[i][2] == l]
+            rest_box = [i for i in box if i not in segment]
+            rest_line = [i for i in line if i not in segment]
+            unit_intersections[b].append(len(intersections))
+            unit_intersections[l].append(len(intersections))
+            intersections.append((segment, rest_box, rest_line))
+    return (boxes, rows, cols, units, cell_units, peers, intersections,
+        unit_intersections)
+
+(BOXES, ROWS, COLS, UNITS, CELL_UNITS, PEERS, INTERSECTIONS,
+    UNIT_INTERSECTIONS) = _initialize_geometry()
+
+# techniques.TECHNIQUES used by default: naked pairs cut the search on the
+# hard puzzles by 40% and pay for themselves, the others cost more time than
+# the branches they save
+DEFAULT_TECHNIQUES = ("naked_pairs",)
+
+class BitBoard(object):
+    """ A sudoku board made of candidate bitmasks. Use BitBoard.from_str() or
+    BitBoard.from_table() to build one, BitBoard.solve() to solve it and
+    BitBoard.to_table() to convert it back to the format of Sudoku.table. """
+
+    __slots__ = ("cells", "nodes", "trail", "techniques", "eliminations",
+        "budget")
+
+    def __init__(self, cells):
+        self.cells = list(cells)
+        self.nodes = 0 # number of branches tried by the search
+        # undo information for search_inplace(): (index, old mask) pairs
+        # flattened into one list
+        self.trail = []
+        # extra deduction techniques used by propagate(), see techniques.py
+        self.techniques = []
+        self.eliminations = {} # technique name -> cells it changed
+        self.budget = None # budget.Budget charged for every branch, if any
+
+    @classmethod
+    def from_str(cls, instr):
+        """ reads in an 81 character puzzle string, "0" marks an empty cell """
+        if len(instr) < 81:
+            raise ValueError("an 81 character puzzle string is needed")
+        return cls(ALL if char in "0." else 1 << (int(char)-1)
+            for char in instr[:81])
+
+    @classmethod
+    def from_table(cls, table):
+        """ converts a table of candidate sets (see Sudoku.table) of a 9x9
+        board """
+        if len(table) != 81:
+            raise ValueError("The bitmask engine only takes 9x9 boards.")
+        cells = [0]*81
+        for (row, col), cands in table.iteritems():
+            mask = 0
+            for cand in cands:
+                mask |= 1 << (cand-1)
+            cells[row*9+col] = mask
+        return cls(cells)
+
+    def to_table(self):
+        """ converts the board to a table of candidate sets (see Sudoku.table) """
+        return {(i // 9, i % 9): set(DIGIT[bit] for bit in BITS[mask])
+            for i, mask in enumerate(self.cells)}
+
+    def to_str(self):
+        """ 81 character representation, unsolved cells are written as "0" """
+        return "".join(str(DIGIT[mask]) for mask in self.cells)
+
+    # solving
+
+    def solve(self, inplace=True, techniques=DEFAULT_TECHNIQUES):
+        """ Solves the board in place. Returns True if a solution was found
+        and False if the puzzle is inconsistent. With inplace=False every
+        branch of the search works on its own copy of the board instead of
+        the undo trail (see search() and search_inplace()). techniques
+        names the techniques.TECHNIQUES that propagate() should use when
+        singles and pointing get stuck. """
+        self.use_techniques(techniques)
+        if not self.propagate():
+            return False
+        if inplace:
+            del self.trail[:] # the root state is never undone
+            return self.search_inplace()
+        solution = self.search(self.cells)
+        if solution is None:
+            return False
+        self.cells = solution
+        return True
+
+    def count(self, limit=None, techniques=DEFAULT_TECHNIQUES):
+        """ Returns the number of solutions, counting stops at limit (if
+        given). The search works on the undo trail, so the board is left
+        propagated but unsolved. """
+        self.use_techniques(techniques)
+        if not self.propagate():
+            return 0
+        del self.trail[:]
+        return self.count_inplace(limit)
+
+    def use_techniques(self, techniques):
+        """ sets up the techniques.TECHNIQUES named for propagate() """
+        if techniques:
+            from techniques import TECHNIQUES
+            self.techniques = [(name, TECHNIQUES[name]) for name in TECHNIQUES
+                if name in techniques]
+            self.eliminations = dict.fromkeys(techniques, 0)
+
+    def propagate(self, cells=None, queue=None, trail=None):
+        """ Constraint propagation driven by a work queue. queue lists the
+        cells whose candidates have shrunk (every cell by default). A cell
+        taken from the queue removes its value from its peers if it is
+        single, and marks its 3 units dirty. A dirty unit is checked for
+        hidden singles and for pointing/claiming candidates in its box-line
+        intersections. Any cell that loses a candidate goes back to the
+        queue, so the work done is proportional to the number of changes.
+        When the queue runs dry, the enabled techniques (see solve()) get
+        their turn, and the cells they change go back to the queue.
+        Every candidate removal is recorded on trail if one is given.
+        Returns False if a contradiction is found. """
+        if cells is None:
+            cells = self.cells
+        if queue is None:
+            queue = range(81)
+        if trail is None:
+            trail = [] # nobody is going to undo these changes
+        record = trail.extend
+        queued = [False]*81
+        for i in queue:
+            queued[i] = True
+        done = [False]*81 # single cells whose value was removed from the peers
+        dirty = [False]*27
+        units = []
+        while True:
+            while queue or units:
+                while queue:
+                    i = queue.pop()
+                    queued[i] = False
+                    mask = cells[i]
+                    if not done[i] and POPCOUNT[mask] == 1: # naked single
+                        done[i] = True
+                        notmask = ~mask
+                        for j in PEERS[i]:
+                            peer = cells[j]
+                            if peer & mask:
+                                record((j, peer))
+                                peer &= notmask
+                                cells[j] = peer
+                                if not peer:
+                                    return False
+                                if not queued[j]:
+                                    queued[j] = True
+                                    queue.append(j)
+                    for u in CELL_UNITS[i]:
+                        if not dirty[u]:
+                            dirty[u] = True
+                            units.append(u)
+                if not units:
+                    break
+                u = units.pop()
+                dirty[u] = False
+                # hidden singles
+                unit = UNITS[u]
+                once = twice = 0
+                for i in unit:
+                    mask = cells[i]
+                    twice |= once & mask
+                    once |= mask
+                if once != ALL:
+                    return False # some digit has no place left in this unit
+                once &= ~twice
+                if once:
+                    for i in unit:
+                        mask = cells[i] & once
+                        if mask and cells[i] != mask:
+                            if POPCOUNT[mask] != 1:
+                                return False # two digits need this very cell
+                            record((i, cells[i]))
+                            cells[i] = mask
+                            if not queued[i]:
+                                queued[i] = True
+                                queue.append(i)
+                # pointing and claiming
+                for segment, rest_box, rest_line in (INTERSECTIONS[k]
+                        for k in UNIT_INTERSECTIONS[u]):
+                    inside = 0
+                    for i in segment:
+                        inside |= cells[i]
+                    in_box = in_line = 0
+                    for i in rest_box:
+                        in_box |= cells[i]
+                    for i in rest_line:
+                        in_line |= cells[i]
+                    # digits of the segment that can't go anywhere else in the box
+                    # have to leave the rest of the line, and vice versa
+                    for mask, rest in ((inside & ~in_box & in_line, rest_line),
+                            (inside & ~in_line & in_box, rest_box)):
+                        if not mask:
+                            continue
+                        notmask = ~mask
+                        for j in rest:
+                            cell = cells[j]
+                            if cell & mask:
+                                record((j, cell))
+                                cell &= notmask
+                                cells[j] = cell
+                                if not cell:
+                                    return False
+                                if not queued[j]:
+                                    queued[j] = True
+                                    queue.append(j)
+            # the queue has run dry, try the techniques cheapest first
+            for name, technique in self.techniques:
+                changed = technique(cells, record)
+                if changed is None:
+                    return False
+                if changed:
+                    self.eliminations[name] += len(changed)
+                    for i in changed:
+                        if not queued[i]:
+                            queued[i] = True
+                            queue.append(i)
+                    break
+            else:
+                return True
+
+    def search(self, cells):
+        """ Depth first search on the cell with the fewest candidates. Every
+        branch works on its own copy of the board. Returns the solved list of
+        cells or None. """
+        best = None
+        mincount = 10
+        for i in xrange(81):
+            count = POPCOUNT[cells[i]]
+            if 1 < count < mincount:
+                best, mincount = i, count
+                if count == 2:
+                    break
+        if best is None:
+            return cells # every cell is filled in
+        for bit in BITS[cells[best]]:
+            self.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
+            child = cells[:]
+            child[best] = bit
+            if self.propagate(child, [best]):
+                solution = self.search(child)
+                if solution is not None:
+                    return solution
+        return None
+
+    def search_inplace(self):
+        """ Depth first search on the cell with the fewest candidates that
+        works on self.cells directly. Every candidate removal is recorded on
+        self.trail and a failed branch is rolled back to its checkpoint with
+        undo(), so the board is never copied and the trail can't grow longer
+        than the total number of candidates. Returns True if self.cells has
+        been solved. """
+        cells = self.cells
+        trail = self.trail
+        best = None
+        mincount = 10
+        for i in xrange(81):
+            count = POPCOUNT[cells[i]]
+            if 1 < count < mincount:
+                best, mincount = i, count
+                if count == 2:
+                    break
+        if best is None:
+            return True # every cell is filled in
+        mask = cells[best]
+        for bit in BITS[mask]:
+            self.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
+            checkpoint = len(trail)
+            trail.extend((best, mask))
+            cells[best] = bit
+            if self.propagate(cells, [best], trail) and self.search_inplace():
+                return True
+            self.undo(checkpoint)
+        return False
+
+    def count_inplace(self, limit=None):
+        """ The counting counterpart of search_inplace(): tries every
+        branch (until limit solutions are found) and undoes all of them. """
+        cells = self.cells
+        trail = self.trail
+        best = None
+        mincount = 10
+        for i in xrange(81):
+            count = POPCOUNT[cells[i]]
+            if 1 < count < mincount:
+                best, mincount = i, count
+                if count == 2:
+                    break
+        if best is None:
+            return 1 # every cell is filled in
+        mask = cells[best]
+        count = 0
+        for bit in BITS[mask]:
+            self.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
+            checkpoint = len(trail)
+            trail.extend((best, mask))
+            cells[best] = bit
+            if self.propagate(cells, [best], trail):
+                count += self.count_inplace(None if limit is None else limit - count)
+            self.undo(checkpoint)
+            if limit is not None and count >= limit:
+                break
+        return count
+
+    def undo(self, checkpoint):
+        """ Roll self.cells back to the state when the trail had checkpoint
+        entries. """
+        cells = self.cells
+        trail = self.trail
+        while len(trail) > checkpoint:
+            old = trail.pop()
+            cells[trail.pop()] = old
@@ -0,0 +1,34 @@
+#! /usr/bin/python
+
+#  Search budgets
+#
+#  A Budget is handed to Sudoku.solve() through its deadline and max_nodes
+#  arguments and charged for every search node by every engine. Running out
+#  raises BudgetExceeded, which unwinds the search; Sudoku.solve() turns it
+#  into its BUDGET_EXCEEDED result.
+
+import time
+
+class BudgetExceeded(Exception):
+    pass
+
+class Budget(object):
+    """ Limits of a search: a deadline (a time.time() value) and a maximum
+    number of search nodes, either of them can be None. nodes counts the
+    nodes charged so far. """
+
+    __slots__ = ("deadline", "max_nodes", "nodes")
+
+    def __init__(self, deadline=None, max_nodes=None):
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def charge(self):
+        """ called on every search node, raises BudgetExceeded if the node
+        is over the budget """
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded("More than {!s} nodes.".format(self.max_nodes))
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded("Deadline passed after {!s} nodes.".format(self.nodes))
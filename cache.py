@@ -0,0 +1,89 @@
+#! /usr/bin/python
+
+#  Solution cache keyed by the symmetry class of the puzzle
+#
+#  Puzzles that are the same up to relabeling, band/stack and row/column
+#  permutations and transposition share one entry: the solution of their
+#  canonical form (see canonical.py), which is mapped back through the
+#  inverse transform on every hit.
+
+import os
+import tempfile
+
+from collections import OrderedDict
+from canonical import canonicalize
+
+class SolutionCache(object):
+    """ A bounded LRU cache of solutions. get() and put() take 81 character
+    puzzle and solution strings. The counters hits, misses, evictions and
+    skipped (puzzles too symmetric to canonicalize cheaply, see
+    canonical.canonicalize()) help to size it. With a path the entries are
+    loaded from that file and save() writes them back. """
+
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict() # canonical puzzle -> canonical solution
+        self.hits = self.misses = self.evictions = self.skipped = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, puzzle):
+        """ Returns the cached solution of puzzle or None """
+        result = canonicalize(puzzle)
+        if result is None:
+            self.skipped += 1
+            return None
+        canon, transform = result
+        try:
+            solution = self.entries.pop(canon)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries[canon] = solution # it is the most recently used now
+        self.hits += 1
+        return transform.invert(solution)
+
+    def put(self, puzzle, solution):
+        """ Stores the solution of puzzle, evicting the least recently used
+        entries if the cache is full """
+        result = canonicalize(puzzle)
+        if result is None:
+            return
+        canon, transform = result
+        self.entries.pop(canon, None)
+        self.entries[canon] = transform.apply(solution)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"size": len(self.entries), "maxsize": self.maxsize,
+            "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "skipped": self.skipped}
+
+    def clear(self):
+        self.entries.clear()
+
+    def load(self, path):
+        """ reads entries written by save(), oldest first """
+        with open(path) as infile:
+            for line in infile:
+                try:
+                    canon, solution = line.split()
+                except ValueError:
+                    continue
+                self.entries[canon] = solution
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def save(self, path=None):
+        """ writes the entries to path (the one given to the constructor by
+        default), replacing the file atomically """
+        path = path or self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmppath = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as outfile:
+            for canon, solution in self.entries.iteritems():
+                outfile.write("{!s} {!s}\n".format(canon, solution))
+        os.rename(tmppath, path)
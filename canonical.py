@@ -0,0 +1,182 @@
+#! /usr/bin/python
+
+#  Canonical form of sudoku puzzles
+#
+#  Two puzzles belong to the same symmetry class if one can be turned into
+#  the other by transposing the grid, permuting the bands (stacks), permuting
+#  the rows (columns) within the bands (stacks) and relabeling the digits.
+#  canonicalize() picks the lexicographically smallest member of the class
+#  (empty cells are 0, and the digits are relabeled 1, 2, 3, ... in order of
+#  their first appearance) and returns the Transform that maps the puzzle to
+#  it, so that a solution of the canonical puzzle can be mapped back.
+#
+#  Trying all the 2*1296*1296 grid transformations would be far too slow, so
+#  the smallest string is built row by row instead: for every target row all
+#  the possible source rows are tried, and the column order is only decided
+#  as far as the rows seen so far require it. Columns (and stacks) that
+#  looked the same in every row so far are kept together in a tied group,
+#  and only the rows which tell them apart split the group.
+
+from itertools import permutations, product
+from decorators import memoize
+
+NEW = 10 # stands for a digit that hasn't got a label yet, bigger than all labels
+
+class Transform(object):
+    """ A symmetry of the sudoku grid: transpose or not, the source row of
+    every target row, the source column of every target column and the
+    labels of the digits. """
+
+    def __init__(self, transpose, rows, cols, labels):
+        self.transpose = transpose
+        self.rows = rows
+        self.cols = cols
+        # complete the relabeling with the digits that don't occur
+        labels = dict(labels)
+        unused = sorted(set(xrange(1, 10)) - set(labels.itervalues()))
+        for digit in xrange(1, 10):
+            if digit not in labels:
+                labels[digit] = unused.pop(0)
+        self.labels = labels
+        self.inverse_labels = {label: digit for digit, label in labels.iteritems()}
+
+    def _source(self, row, col):
+        """ index of the cell of the original string that goes to (row, col) """
+        row, col = self.rows[row], self.cols[col]
+        if self.transpose:
+            row, col = col, row
+        return row*9 + col
+
+    def apply(self, instr):
+        """ maps an 81 character string (a puzzle or a solution) to the
+        canonical side """
+        out = []
+        for row in xrange(9):
+            for col in xrange(9):
+                digit = int(instr[self._source(row, col)])
+                out.append(str(self.labels[digit]) if digit else "0")
+        return "".join(out)
+
+    def invert(self, instr):
+        """ maps an 81 character string from the canonical side back """
+        out = ["0"]*81
+        for row in xrange(9):
+            for col in xrange(9):
+                digit = int(instr[row*9 + col])
+                if digit:
+                    out[self._source(row, col)] = str(self.inverse_labels[digit])
+        return "".join(out)
+
+def _refine_stack(stack, values, labels):
+    """ Orders the column groups of a stack to make this row as small as
+    possible: empty cells first, then the labeled digits by label, then the
+    new digits. Returns the key of the stack (new digits are NEW) and every
+    possible refined stack along with its new digit columns in order. """
+    key = []
+    choices = []
+    for group in stack:
+        zeros = tuple(col for col in group if not values[col])
+        labeled = sorted((labels[values[col]], col) for col in group
+            if values[col] in labels)
+        new = [col for col in group if values[col] and values[col] not in labels]
+        key.extend([0]*len(zeros) + [label for label, col in labeled] + [NEW]*len(new))
+        fixed = ((zeros,) if zeros else ()) + tuple((col,) for label, col in labeled)
+        choices.append([(fixed + tuple((col,) for col in order), order)
+            for order in permutations(new)])
+    variants = []
+    for combination in product(*choices):
+        variants.append((tuple(group for groups, order in combination for group in groups),
+            [col for groups, order in combination for col in order]))
+    return tuple(key), variants
+
+def _refine(colstate, values, labels):
+    """ Orders the columns as far as needed to make the row with the given
+    values as small as possible. colstate is a sequence of tied stack groups,
+    each a sequence of stacks, each a sequence of tied column groups.
+    Returns the key of the row and a list of (colstate, new digit columns in
+    order) for every way to reach it. """
+    key = []
+    options = []
+    for stackgroup in colstate:
+        refined = sorted((_refine_stack(stack, values, labels) + (n,)
+            for n, stack in enumerate(stackgroup)), key=lambda x: (x[0], x[2]))
+        group_options = [((), [])]
+        start = 0
+        while start < len(refined):
+            end = start + 1
+            while end < len(refined) and refined[end][0] == refined[start][0]:
+                end += 1
+            run = refined[start:end]
+            key.extend(run[0][0] * len(run))
+            if NEW not in run[0][0] and len(run) > 1:
+                # the stacks look the same in this row, keep them tied
+                run_options = [((tuple(variants[0][0] for k, variants, n in run),), [])]
+            else:
+                run_options = []
+                for order in permutations(run):
+                    for combination in product(*[variants for k, variants, n in order]):
+                        run_options.append((tuple((stack,) for stack, new in combination),
+                            [col for stack, new in combination for col in new]))
+            group_options = [(groups + more, new + new_more)
+                for groups, new in group_options for more, new_more in run_options]
+            start = end
+        options.append(group_options)
+    results = []
+    for combination in product(*options):
+        results.append((tuple(group for groups, new in combination for group in groups),
+            [col for groups, new in combination for col in new]))
+    return tuple(key), results
+
+@memoize(maxsize=256)
+def canonicalize(puzzle, limit=2000):
+    """ Returns the canonical form of an 81 character puzzle string and the
+    Transform that maps the puzzle to it. Grids with many full rows (like
+    solutions) tie on an enormous number of column orders, so None is
+    returned instead when more than limit partial transforms would have to
+    be followed. The latest results are memoized (a cache lookup and the
+    store after a miss canonicalize the same puzzle). """
+    grid = [[int(char) if char.isdigit() else 0 for char in puzzle[row*9:row*9+9]]
+        for row in xrange(9)]
+    grids = [grid, [list(col) for col in zip(*grid)]]
+    # one tied group of the 3 stacks, each a tied group of its 3 columns
+    start = (tuple(((col, col+1, col+2),) for col in (0, 3, 6)),)
+    # state: (transpose, source rows, colstate, labels)
+    frontier = [(transpose, (), start, ()) for transpose in (0, 1)]
+    for target in xrange(9):
+        best = None
+        candidates = []
+        seen = set()
+        for transpose, rows, colstate, labels in frontier:
+            if target % 3 == 0:
+                used = set(row // 3 for row in rows)
+                sources = [row for row in xrange(9) if row // 3 not in used]
+            else:
+                band = rows[-1] // 3
+                sources = [row for row in xrange(band*3, band*3+3) if row not in rows]
+            labeldict = dict(labels)
+            for source in sources:
+                values = grids[transpose][source]
+                key, results = _refine(colstate, values, labeldict)
+                if best is not None and key > best:
+                    continue
+                if key != best:
+                    best = key
+                    candidates = []
+                    seen = set()
+                for newstate, newcols in results:
+                    newlabels = labels
+                    for col in newcols:
+                        if values[col] not in dict(newlabels): # duplicates are bogus
+                            newlabels += ((values[col], len(newlabels)+1),)
+                    state = (transpose, rows + (source,), newstate, newlabels)
+                    if state not in seen:
+                        seen.add(state)
+                        candidates.append(state)
+                if len(candidates) > limit:
+                    return None
+        frontier = candidates
+    transpose, rows, colstate, labels = frontier[0]
+    cols = [col for stackgroup in colstate for stack in stackgroup
+        for group in stack for col in sorted(group)]
+    transform = Transform(transpose, list(rows), cols, dict(labels))
+    return transform.apply(puzzle), transform
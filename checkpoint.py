@@ -0,0 +1,180 @@
+#! /usr/bin/python
+
+#  Checkpoints for long batch runs
+#
+#  A run with a checkpoint writes its solutions as it goes. Every now and
+#  then it flushes them to disk and then records its progress: how far it
+#  got in the input, how many puzzles it completed and how much of the
+#  output is flushed. A run that is started again with the same checkpoint
+#  truncates the output to that size and carries on from there, so the
+#  output ends up the same as that of a run that was never interrupted.
+#
+#      ./sudoku.py --batch out.txt --checkpoint out.ckpt puzzles.txt
+#
+#  A sharded run (shard number n of count) only solves the puzzles whose
+#  position in the input is n modulo count. The outputs of the count shards
+#  can be merged back into the output of a single run:
+#
+#      ./sudoku.py --batch out.0 --checkpoint out.0.ckpt --shard 0/2 puzzles.txt
+#      ./sudoku.py --batch out.1 --checkpoint out.1.ckpt --shard 1/2 puzzles.txt
+#      ./checkpoint.py merge out.txt out.0 out.1
+
+import json
+import os
+
+from sudoku import BOARD_SIZES, SudokuError
+
+class Checkpoint(object):
+    """ The progress of a run:
+
+    position     puzzles of the input read (of every shard)
+    offset       bytes of the input read (None for a SudokuCollection)
+    completed    puzzles of the shard solved and written
+    output_size  bytes of the output flushed
+    bogus        puzzles that couldn't be solved
+    shard        (number, count), (0, 1) for a run without shards
+    finished     whether the run is over
+    """
+
+    FIELDS = ("position", "offset", "completed", "output_size", "bogus",
+        "shard", "finished")
+
+    def __init__(self, shard=(0, 1)):
+        self.position = 0
+        self.offset = 0
+        self.completed = 0
+        self.output_size = 0
+        self.bogus = 0
+        self.shard = tuple(shard)
+        self.finished = False
+
+    @classmethod
+    def load(cls, path):
+        """ the checkpoint saved at path, None if there is none """
+        try:
+            with open(path) as infile:
+                fields = json.load(infile)
+        except IOError:
+            return None
+        checkpoint = cls()
+        for name in cls.FIELDS:
+            setattr(checkpoint, name, fields[name])
+        checkpoint.shard = tuple(checkpoint.shard)
+        return checkpoint
+
+    def save(self, path):
+        """ Writes the checkpoint to a temporary file, syncs it to disk and
+        renames it to path, so path always holds a whole checkpoint. """
+        temp = "{!s}.{!s}.tmp".format(path, os.getpid())
+        with open(temp, "w") as outfile:
+            json.dump(dict((name, getattr(self, name)) for name in self.FIELDS),
+                outfile, sort_keys=True)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.rename(temp, path)
+
+def parse_shard(text):
+    """ "n/count" -> (n, count) """
+    try:
+        number, count = [int(part) for part in text.split("/")]
+    except ValueError:
+        raise SudokuError("A shard is given as NUMBER/COUNT, not {!r}.".format(text))
+    if not 0 <= number < count:
+        raise SudokuError("No shard {!s} of {!s}.".format(number, count))
+    return number, count
+
+class CheckpointedOutput(object):
+    """ The output of a run with a checkpoint at path. Opening it resumes
+    the checkpoint, if there is one: outfile is truncated to the size it
+    records. (outfile has to be a plain file opened for appending or
+    updating, "a" or "r+".) write() appends solutions and saves the
+    checkpoint after they are on disk. """
+
+    def __init__(self, outfile, path, shard=None):
+        self.outfile = outfile
+        self.path = path
+        shard = tuple(shard or (0, 1))
+        checkpoint = Checkpoint.load(path)
+        if checkpoint is None:
+            checkpoint = Checkpoint(shard)
+        elif checkpoint.shard != shard:
+            raise SudokuError("The checkpoint {!s} is of shard {!s}/{!s}.".format(
+                path, checkpoint.shard[0], checkpoint.shard[1]))
+        self.checkpoint = checkpoint
+        outfile.seek(checkpoint.output_size)
+        outfile.truncate()
+
+    def write(self, solutions, position, offset=None, bogus=0):
+        """ appends the solutions (strings) to the output, then records that
+        the input was read up to position (and offset) """
+        outfile = self.outfile
+        outfile.write("".join(solution + "\n" for solution in solutions))
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        checkpoint = self.checkpoint
+        checkpoint.completed += len(solutions)
+        checkpoint.position = position
+        checkpoint.offset = offset
+        checkpoint.output_size = outfile.tell()
+        checkpoint.bogus += bogus
+        checkpoint.save(self.path)
+
+    def finish(self):
+        self.checkpoint.finished = True
+        self.checkpoint.save(self.path)
+
+def read_positions(infile, position=0, offset=0):
+    """ Yields (puzzle, position, offset) for every puzzle of infile (see
+    stream.iter_puzzles()) from offset on: its position in the input (the
+    position of the puzzle at offset is position) and the offset of the
+    line after it. """
+    if offset:
+        infile.seek(offset)
+    for line in infile:
+        offset += len(line)
+        description = line.strip()
+        if len(description) in BOARD_SIZES:
+            yield description, position, offset
+            position += 1
+
+def merge_shards(inputs, outfile):
+    """ Writes the lines of the outputs of the shards of a run (files in
+    the order of the shards) to outfile in the order of the input: the
+    first line of every shard, then the second ones, ... Returns the
+    number of lines written. """
+    written = 0
+    while True:
+        line = inputs[written % len(inputs)].readline()
+        if not line:
+            break
+        outfile.write(line)
+        written += 1
+    if any(shard.readline() for shard in inputs):
+        raise SudokuError("The shards don't belong to the same run.")
+    return written
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Checkpointed runs")
+    commands = parser.add_subparsers(dest="command")
+    command = commands.add_parser("merge", help="merge the outputs of the "
+        "shards of a run, given in the order of the shards")
+    command.add_argument("output")
+    command.add_argument("shards", nargs="+")
+    command = commands.add_parser("show", help="print a checkpoint")
+    command.add_argument("checkpoint")
+    args = parser.parse_args()
+    if args.command == "merge":
+        inputs = [open(path) for path in args.shards]
+        try:
+            with open(args.output, "w") as outfile:
+                print "{!s} lines".format(merge_shards(inputs, outfile))
+        finally:
+            for infile in inputs:
+                infile.close()
+    else:
+        checkpoint = Checkpoint.load(args.checkpoint)
+        if checkpoint is None:
+            raise SudokuError("No checkpoint at {!s}.".format(args.checkpoint))
+        for name in Checkpoint.FIELDS:
+            print "{!s}: {!s}".format(name, getattr(checkpoint, name))
@@ -1,41 +1,136 @@
 #! /usr/bin/python
 #
-# 
+#
+
+import sys
+import threading
+import time
 
+from collections import OrderedDict
 from functools import update_wrapper
 
+__all__ = ["decorator", "memoize", "memo", "memoid", "memotables",
+    "clear_all", "memo_stats", "MemoTable"]
+
 def decorator(func):
     return lambda f: update_wrapper(func(f), f)
 decorator = decorator(decorator)
 
-memotables = {}
+memotables = {} # "module.function" -> MemoTable of every memoized function
 
-@decorator
-def memo(f): 
-    """ memoize a function """
-    memo = f.memo_table = {} #initialize memo for this function
-    def f2(*args):
-        try:
-            result = memo[args]
-        except KeyError:
-            memo[args] = f(*args)
-            result = memo[args]
-        return result
-    return f2
+KEYWORDS = object() # separates the positional from the keyword arguments in a key
+
+class MemoTable(object):
+    """ The memo of a single function: an LRU table holding at most maxsize
+    results (unbounded if maxsize is None), each for at most ttl seconds
+    (forever if ttl is None). The statistics are updated under a lock, so
+    the table can be shared by threads; every process has its own tables,
+    use memo_stats() to collect them. """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (result, expiry time, size)
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.bytes = 0
+
+    def lookup(self, key):
+        """ Returns (True, result) on a hit and (False, None) on a miss """
+        with self.lock:
+            try:
+                entry = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False, None
+            if entry[1] is not None and entry[1] < time.time():
+                self.bytes -= entry[2]
+                self.evictions += 1
+                self.misses += 1
+                return False, None
+            self.entries[key] = entry # it is the most recently used now
+            self.hits += 1
+            return True, entry[0]
+
+    def store(self, key, result):
+        size = sys.getsizeof(key) + sys.getsizeof(result)
+        expiry = None if self.ttl is None else time.time() + self.ttl
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.entries[key] = (result, expiry, size)
+            self.bytes += size
+            while self.maxsize is not None and len(self.entries) > self.maxsize:
+                evicted = self.entries.popitem(last=False)[1]
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """ a snapshot of the statistics as a plain (picklable) dict """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "bytes": self.bytes,
+                "size": len(self.entries), "maxsize": self.maxsize}
+
+def memoize(maxsize=1024, ttl=None, key=None):
+    """ Returns a decorator that memoizes a function in a MemoTable. The
+    arguments (keyword arguments sorted by name) are the key unless a key
+    function is given, which maps the arguments to the key. The table is f.memo_table, f.cache_info() returns
+    its statistics and f.cache_clear() empties it. """
+    def memoizer(f):
+        table = MemoTable(maxsize, ttl)
+        memotables["{!s}.{!s}".format(f.__module__, f.__name__)] = table
+        def f2(*args, **kwargs):
+            if key is not None:
+                k = key(*args, **kwargs)
+            elif kwargs:
+                k = args + (KEYWORDS,) + tuple(sorted(kwargs.items()))
+            else:
+                k = args
+            found, result = table.lookup(k)
+            if not found:
+                result = f(*args, **kwargs)
+                table.store(k, result)
+            return result
+        f2.memo_table = table
+        f2.cache_info = table.stats
+        f2.cache_clear = table.clear
+        return update_wrapper(f2, f)
+    return memoizer
+
+memo = memoize() # memoize a function, keeping the 1024 latest results
 
 @decorator
-def memoid(f): #TODO do we need this?
+def memoid(f):
     """ memoize a function, based on the id()-s of its inputs
     not on their values. Only use on functions which neglect
-    the value of their arguments"""
-    memo = memotables[f.__name__] = {} #initialize memo for this function
+    the value of their arguments. The arguments are kept in the
+    table along with the result, so that their id()-s can't be
+    reused by other objects while the entry lives."""
+    table = MemoTable()
+    memotables["{!s}.{!s}".format(f.__module__, f.__name__)] = table
     def f2(*args):
         idargs = tuple(map(id, args))
-        try:
-            result = memo[idargs]
-        except KeyError:
-            memo[idargs] = f(*args)
-            result = memo[idargs]
-        return result
+        found, entry = table.lookup(idargs)
+        if not found or any(a is not b for a, b in zip(entry[0], args)):
+            entry = (args, f(*args))
+            table.store(idargs, entry)
+        return entry[1]
+    f2.memo_table = table
+    f2.cache_info = table.stats
+    f2.cache_clear = table.clear
     return f2
 
+def clear_all():
+    """ empties the memo of every memoized function """
+    for table in memotables.itervalues():
+        table.clear()
+
+def memo_stats():
+    """ statistics of every memoized function in this process """
+    return {name: table.stats() for name, table in memotables.iteritems()}
@@ -0,0 +1,251 @@
+#! /usr/bin/python
+
+#  Exact cover engine for the sudoku solver
+#
+#  A 9x9 sudoku is an exact cover problem with 324 columns (constraints):
+#
+#      0 -  80  cell (row, col) is filled in
+#     81 - 161  row has digit d
+#    162 - 242  column has digit d
+#    243 - 323  box has digit d
+#
+#  and one matrix row for every candidate (cell, digit), which covers exactly
+#  4 columns. The matrix is solved with Knuth's Algorithm X on Dancing Links:
+#  every node is an index into the flat link lists L, R, U and D, so covering
+#  and uncovering a column only relinks integers.
+#
+#  Boards with bigger boxes work the same way: a 16x16 board has 4*256
+#  columns, a 25x25 board 4*625. The search only ever looks at the
+#  candidates that are left, so it scales to them much better than the
+#  classic engine of sudoku.py.
+
+from sudoku import BOARD_SIZES, SYMBOLS
+
+COLUMNS = 324 # of a 9x9 board
+
+def constraints(cell, digit, size=3):
+    """ The 4 columns covered by placing digit (1-9) into cell (row*9+col),
+    on a board with size x size boxes (1-16 and row*16+col for size 4) """
+    width = size*size
+    area = width*width
+    row, col = divmod(cell, width)
+    box = (row // size)*size + col // size
+    digit -= 1
+    return (cell, area + row*width + digit, 2*area + col*width + digit,
+        3*area + box*width + digit)
+
+def box_size(cells):
+    """ the box size of a board with that many cells """
+    try:
+        return BOARD_SIZES[cells]
+    except KeyError:
+        raise ValueError("{!s} cells don't make a sudoku board".format(cells))
+
+class DancingLinks(object):
+    """ The exact cover matrix of a sudoku board. Offers the same interface as
+    bitboard.BitBoard: build one with DancingLinks.from_str() or
+    DancingLinks.from_table(), solve it with solve() and read the result with
+    to_table(). Unlike BitBoard it takes 16x16 and 25x25 boards too. """
+
+    __slots__ = ("candidates", "L", "R", "U", "D", "C", "S", "rows",
+            "solution", "nodes", "budget", "width", "columns")
+
+    def __init__(self, candidates):
+        """ candidates is a list of 81 (256, 625) iterables, the possible
+        digits of every cell in row*9+col (row*width+col) order """
+        self.candidates = [sorted(cands) for cands in candidates]
+        size = box_size(len(self.candidates))
+        self.width = size*size
+        self.columns = columns = 4*len(self.candidates)
+        self.nodes = 0 # number of matrix rows tried by search()
+        self.budget = None # budget.Budget charged for every row, if any
+        self.solution = [] # nodes of the matrix rows selected so far
+        # node 0 is the root, nodes 1-324 (1-columns) are the column headers
+        headers = columns + 1
+        self.L = L = [i-1 for i in xrange(headers)]
+        self.R = R = [i+1 for i in xrange(headers)]
+        L[0], R[columns] = columns, 0
+        self.U = U = range(headers)
+        self.D = D = range(headers)
+        self.C = C = range(headers) # column header of every node
+        self.S = S = [0]*headers # number of nodes in every column
+        self.rows = rows = [None]*headers # (cell, digit) of every node
+        for cell, cands in enumerate(self.candidates):
+            for digit in cands:
+                first = len(C)
+                for column in constraints(cell, digit, size):
+                    node = len(C)
+                    header = column + 1
+                    C.append(header)
+                    rows.append((cell, digit))
+                    L.append(node-1)
+                    R.append(node+1)
+                    U.append(U[header])
+                    D.append(header)
+                    D[U[header]] = node
+                    U[header] = node
+                    S[header] += 1
+                L[first] = len(C)-1
+                R[len(C)-1] = first
+
+    @classmethod
+    def from_str(cls, instr):
+        """ reads in an 81 character puzzle string, "0" marks an empty cell.
+        256 and 625 character strings are 16x16 and 25x25 boards, written
+        with the symbols of sudoku.SYMBOLS. """
+        if len(instr) < 81:
+            raise ValueError("an 81 character puzzle string is needed")
+        cells = len(instr) if len(instr) in BOARD_SIZES else 81
+        width = box_size(cells)**2
+        every = range(1, width + 1)
+        digits = {"0": every, ".": every}
+        for digit, symbol in enumerate(SYMBOLS[:width], 1):
+            digits[symbol] = digits[symbol.lower()] = [digit]
+        try:
+            return cls([digits[char] for char in instr[:cells]])
+        except KeyError as e:
+            raise ValueError("{!r} is not a symbol of a {!s}x{!s} board".format(
+                e.args[0], width, width))
+
+    @classmethod
+    def from_table(cls, table):
+        """ converts a table of candidate sets (see Sudoku.table) """
+        width = box_size(len(table))**2
+        candidates = [()]*len(table)
+        for (row, col), cands in table.iteritems():
+            candidates[row*width+col] = cands
+        return cls(candidates)
+
+    def to_table(self):
+        """ converts the board to a table of candidate sets (see Sudoku.table).
+        Cells not covered by the selected rows keep their candidates. """
+        width = self.width
+        table = {divmod(i, width): set(cands)
+            for i, cands in enumerate(self.candidates)}
+        for node in self.solution:
+            cell, digit = self.rows[node]
+            table[divmod(cell, width)] = set([digit])
+        return table
+
+    def to_str(self):
+        """ 81 (256, 625) character representation, unsolved cells are
+        written as "0" """
+        out = ["0"]*len(self.candidates)
+        for node in self.solution:
+            cell, digit = self.rows[node]
+            out[cell] = SYMBOLS[digit-1]
+        return "".join(out)
+
+    # solving
+
+    def solve(self):
+        """ Returns True if an exact cover (a solution) was found and False if
+        the puzzle is inconsistent. """
+        return self.search()
+
+    def search(self):
+        """ Algorithm X: cover the column with the fewest nodes and try its
+        rows one by one. """
+        L, R, D, C, S = self.L, self.R, self.D, self.C, self.S
+        if R[0] == 0:
+            return True # every constraint is satisfied
+        column, size = 0, self.columns
+        header = R[0]
+        while header:
+            if S[header] < size:
+                column, size = header, S[header]
+                if size < 2:
+                    break
+            header = R[header]
+        if size == 0:
+            return False # a constraint nobody can satisfy
+        self.cover(column)
+        row = D[column]
+        while row != column:
+            self.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
+            self.solution.append(row)
+            node = R[row]
+            while node != row:
+                self.cover(C[node])
+                node = R[node]
+            if self.search():
+                return True
+            self.solution.pop()
+            node = L[row]
+            while node != row:
+                self.uncover(C[node])
+                node = L[node]
+            row = D[row]
+        self.uncover(column)
+        return False
+
+    def count(self, limit=None):
+        """ Returns the number of exact covers (solutions), counting stops
+        at limit (if given). Every cover is undone, so the matrix is left as
+        it was. """
+        L, R, D, C, S = self.L, self.R, self.D, self.C, self.S
+        if R[0] == 0:
+            return 1
+        column, size = 0, self.columns
+        header = R[0]
+        while header:
+            if S[header] < size:
+                column, size = header, S[header]
+                if size < 2:
+                    break
+            header = R[header]
+        if size == 0:
+            return 0
+        count = 0
+        self.cover(column)
+        row = D[column]
+        while row != column:
+            self.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
+            node = R[row]
+            while node != row:
+                self.cover(C[node])
+                node = R[node]
+            count += self.count(None if limit is None else limit - count)
+            node = L[row]
+            while node != row:
+                self.uncover(C[node])
+                node = L[node]
+            if limit is not None and count >= limit:
+                break
+            row = D[row]
+        self.uncover(column)
+        return count
+
+    def cover(self, column):
+        """ unlink column and every row that has a node in it """
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[column]] = L[column]
+        R[L[column]] = R[column]
+        row = D[column]
+        while row != column:
+            node = R[row]
+            while node != row:
+                U[D[node]] = U[node]
+                D[U[node]] = D[node]
+                S[C[node]] -= 1
+                node = R[node]
+            row = D[row]
+
+    def uncover(self, column):
+        """ the exact inverse of cover() """
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        row = U[column]
+        while row != column:
+            node = L[row]
+            while node != row:
+                S[C[node]] += 1
+                U[D[node]] = node
+                D[U[node]] = node
+                node = L[node]
+            row = U[row]
+        L[R[column]] = column
+        R[L[column]] = column
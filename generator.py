@@ -0,0 +1,233 @@
+#! /usr/bin/python
+
+#  Puzzle generator with difficulty grades
+#
+#  A puzzle is made by filling in a random grid, then taking its clues away
+#  in random order, as long as the puzzle stays solvable the way its grade
+#  demands. That check is what makes generation slow (one propagation, or
+#  one solution count, per clue), so every puzzle dug out can be turned into
+#  further random variants of it: relabeling the digits and shuffling the
+#  bands, rows, stacks and columns (see canonical.Transform) keeps both the
+#  unique solution and the grade, and costs next to nothing.
+#
+#      ./generator.py --count 10000 --grade medium --variants 20 -o out.txt
+#
+#  The output has one 81 character puzzle per line, like the files in
+#  puzzles/.
+
+import random
+import sys
+
+from multiprocessing import Pool, cpu_count
+from bitboard import ALL, BOXES, DIGIT, POPCOUNT, BitBoard
+from canonical import Transform
+from sudoku import SudokuError
+
+# the grades generate() makes, easiest first:
+#   easy     singles and pointing/claiming are enough (BitBoard.propagate())
+#   medium   needs the techniques of techniques.py, but no search
+#   hard     needs search, fewer than EXTREME_NODES branches
+# rate() also tells "extreme" puzzles apart, the ones that need
+# EXTREME_NODES or more branches. Taking clues out at random practically
+# never ends up with one (none in hundreds of digs), so they are not
+# generated.
+GRADES = ("easy", "medium", "hard")
+EXTREME_NODES = 30
+
+def _solved(cells):
+    return all(POPCOUNT[mask] == 1 for mask in cells)
+
+def _cells(puzzle):
+    return [ALL if char == "0" else 1 << (int(char)-1) for char in puzzle]
+
+def random_grid(rng=random):
+    """ A random solved grid as an 81 character string: the three boxes on
+    the diagonal don't constrain each other, so they are filled in with
+    random permutations and the search completes the rest. The result is
+    shuffled by a random grid transformation too. """
+    cells = [ALL]*81
+    for box in (BOXES[0], BOXES[4], BOXES[8]):
+        digits = range(1, 10)
+        rng.shuffle(digits)
+        for i, digit in zip(box, digits):
+            cells[i] = 1 << (digit-1)
+    board = BitBoard(cells)
+    board.solve(techniques=())
+    return random_transform(rng).apply(board.to_str())
+
+def random_transform(rng=random):
+    """ a random canonical.Transform """
+    def shuffled(seq):
+        seq = list(seq)
+        rng.shuffle(seq)
+        return seq
+    rows = [band*3 + row for band in shuffled(xrange(3)) for row in shuffled(xrange(3))]
+    cols = [stack*3 + col for stack in shuffled(xrange(3)) for col in shuffled(xrange(3))]
+    labels = dict(zip(xrange(1, 10), shuffled(xrange(1, 10))))
+    return Transform(rng.random() < 0.5, rows, cols, labels)
+
+def variants(puzzle, count, rng=random):
+    """ Yields count random variants of puzzle (the first one is puzzle
+    itself). Variants can coincide, but that is unlikely with 3 billion
+    transformations to choose from. """
+    yield puzzle
+    for _ in xrange(count-1):
+        yield random_transform(rng).apply(puzzle)
+
+def _keeps(grade):
+    """ the test a puzzle (as a list of cell masks) has to pass while digging
+    for grade: the propagation of that grade solves it, or for the search
+    grades, it has exactly one solution """
+    if grade == "hard":
+        return lambda cells: BitBoard(cells).count(2, techniques=()) == 1
+    def keeps(cells):
+        board = BitBoard(cells)
+        if not board.propagate():
+            return False
+        if _solved(board.cells):
+            return True
+        if grade == "easy":
+            return False
+        # most removals don't need the (much slower) techniques, so they
+        # only get their turn now
+        from techniques import TECHNIQUES
+        board.use_techniques(TECHNIQUES)
+        return board.propagate() and _solved(board.cells)
+    return keeps
+
+def dig(grid, grade="easy", rng=random):
+    """ Takes clues out of a solved grid in random order, keeping every
+    removal that leaves the puzzle solvable as grade demands (see _keeps()).
+    Returns the puzzle, which has a unique solution. """
+    keeps = _keeps(grade)
+    cells = _cells(grid)
+    order = range(81)
+    rng.shuffle(order)
+    for i in order:
+        clue = cells[i]
+        cells[i] = ALL
+        if not keeps(cells):
+            cells[i] = clue
+    return "".join(str(DIGIT[mask]) for mask in cells)
+
+def rate(puzzle):
+    """ Returns the grade of a puzzle (None if it has no solution) and the
+    number of search branches the bitmask engine needed for it """
+    board = BitBoard(_cells(puzzle))
+    if not board.propagate():
+        return None, 0
+    if _solved(board.cells):
+        return "easy", 0
+    from techniques import TECHNIQUES
+    board.use_techniques(TECHNIQUES)
+    if not board.propagate():
+        return None, 0
+    if _solved(board.cells):
+        return "medium", 0
+    board = BitBoard(_cells(puzzle))
+    if not board.solve():
+        return None, board.nodes
+    if board.nodes < EXTREME_NODES:
+        return "hard", board.nodes
+    return "extreme", board.nodes
+
+def generate(grade="easy", rng=random, attempts=100):
+    """ Digs puzzles out of random grids until one of them rates as grade.
+    Returns it, or None if attempts grids were not enough. """
+    if grade not in GRADES:
+        raise ValueError("Unknown grade: {!s}".format(grade))
+    for _ in xrange(attempts):
+        puzzle = dig(random_grid(rng), grade, rng)
+        if rate(puzzle)[0] == grade:
+            return puzzle
+    return None
+
+def generate_many(count, grade="easy", seed=None, per_puzzle=1, attempts=100):
+    """ Yields count puzzles of grade, per_puzzle variants of every puzzle
+    dug out (see variants()). seed makes the run repeatable. Raises
+    SudokuError if generate() finds no puzzle of grade in attempts
+    grids. """
+    rng = random.Random(seed)
+    done = 0
+    while done < count:
+        puzzle = generate(grade, rng, attempts)
+        if puzzle is None:
+            raise SudokuError("No {!s} puzzle in {!s} attempts.".format(grade, attempts))
+        for variant in variants(puzzle, min(per_puzzle, count-done), rng):
+            yield variant
+            done += 1
+
+def generate_job(job):
+    """ Worker function: the list of puzzles of a (count, grade, seed,
+    per_puzzle, attempts) job """
+    count, grade, seed, per_puzzle, attempts = job
+    return list(generate_many(count, grade, seed, per_puzzle, attempts))
+
+def generate_stream(outfile, count, grade="easy", workers=1, seed=None,
+        per_puzzle=1, batch_size=100, attempts=100):
+    """ Writes count puzzles of grade to outfile, one per line, as they are
+    made. With workers other than 1 (0 uses every core) batches of
+    batch_size puzzles are generated in a process pool, every batch with a
+    seed of its own (derived from seed), so a seeded run writes the same
+    file for any number of workers. Returns the number of puzzles written,
+    raises SudokuError if a puzzle takes more than attempts grids (see
+    generate_many()). """
+    rng = random.Random(seed)
+    jobs = []
+    left = count
+    while left > 0:
+        jobs.append((min(batch_size, left), grade, rng.getrandbits(64),
+            per_puzzle, attempts))
+        left -= batch_size
+    pool = None
+    if workers != 1:
+        pool = Pool(workers or cpu_count())
+    try:
+        results = pool.imap(generate_job, jobs) if pool else (generate_job(job) for job in jobs)
+        written = 0
+        for puzzles in results:
+            outfile.write("".join(puzzle + "\n" for puzzle in puzzles))
+            written += len(puzzles)
+        if pool:
+            pool.close()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.join()
+    outfile.flush()
+    return written
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from stream import open_puzzles
+    parser = argparse.ArgumentParser(description="Sudoku puzzle generator")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--grade", default="easy", choices=GRADES)
+    parser.add_argument("--workers", type=int, default=1,
+        help="size of the process pool, 0 uses every core")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--variants", type=int, default=1,
+        help="number of random variants written for every puzzle dug out")
+    parser.add_argument("--attempts", type=int, default=100,
+        help="random grids tried for a puzzle before giving up")
+    parser.add_argument("-o", "--output", default="-",
+        help="output file (- is stdout, .gz files are compressed)")
+    args = parser.parse_args()
+    before = time.time()
+    outfile = open_puzzles(args.output, "w")
+    try:
+        written = generate_stream(outfile, args.count, args.grade, args.workers,
+            args.seed, args.variants, attempts=args.attempts)
+    except SudokuError as e:
+        sys.stderr.write("{!s}\n".format(e))
+        sys.exit(1)
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+    elapsed = time.time() - before
+    sys.stderr.write("{!s} {!s} puzzles in {:.2f} secs, {:.1f} puzzles/sec\n".format(
+        written, args.grade, elapsed, written/elapsed if elapsed else 0.0))
@@ -0,0 +1,75 @@
+#! /usr/bin/python
+
+#  Branching heuristics for the backtracking of the classic engine
+#
+#  When propagation gets stuck, Sudoku.bt() picks an open cell and tries its
+#  candidates one by one. A cell selector picks the cell, a value order
+#  sorts its candidates:
+#
+#      Sudoku(instr=puzzle).solve(select="degree", order="lcv")
+#
+#  Selectors take the Sudoku and return the coordinates of an open cell, or
+#  None if there is none. Value orders take the Sudoku and the cell and
+#  return the candidates in the order they should be tried. They find what
+#  they need in counters that Sudoku.remove_candidate() and
+#  Sudoku.fill_in() keep up to date, so nothing has to rescan the table:
+#  sudoku.buckets[k] is the set of the cells with k candidates (k >= 2),
+#  sudoku.open_counts the number of open cells of every region and
+#  sudoku.placed[d] the number of cells holding digit d.
+#
+#  ./benchmark.py --heuristics compares every combination by search nodes
+#  and time.
+
+def mrv(sudoku):
+    """ minimum remaining values: an open cell with the fewest candidates """
+    for bucket in sudoku.buckets[2:]:
+        if bucket:
+            return next(iter(bucket))
+    return None
+
+def _open_peers(sudoku, coord):
+    table = sudoku.table
+    return sum(1 for peer in sudoku.peersdict[coord] if len(table[peer]) > 1)
+
+def degree(sudoku):
+    """ mrv, ties broken by the number of open peers (the most first): the
+    choice constrains the most other cells """
+    for bucket in sudoku.buckets[2:]:
+        if bucket:
+            return max(bucket, key=lambda coord: _open_peers(sudoku, coord))
+    return None
+
+def unit(sudoku):
+    """ most constrained unit: the mrv cell of the region with the fewest
+    open cells """
+    best, best_count = None, None
+    for index, count in enumerate(sudoku.open_counts):
+        if count and (best_count is None or count < best_count):
+            best, best_count = index, count
+            if count == 2:
+                break
+    if best is None:
+        return None
+    table = sudoku.table
+    return min((coord for coord in sudoku.regions[best] if len(table[coord]) > 1),
+        key=lambda coord: len(table[coord]))
+
+def in_order(sudoku, coord):
+    """ the candidates in the order of the set """
+    return list(sudoku.table[coord])
+
+def lcv(sudoku, coord):
+    """ least constraining value: the candidates that are candidates of the
+    fewest peers first, they rule out the fewest options """
+    table = sudoku.table
+    peers = [table[peer] for peer in sudoku.peersdict[coord]]
+    return sorted(table[coord], key=lambda cand: sum(1 for peer in peers if cand in peer))
+
+def frequency(sudoku, coord):
+    """ digit frequency: the candidates already filled in the most times on
+    the board first, the fewest places are left for them """
+    placed = sudoku.placed
+    return sorted(sudoku.table[coord], key=lambda cand: placed[cand], reverse=True)
+
+CELL_SELECTORS = {"mrv": mrv, "degree": degree, "unit": unit}
+VALUE_ORDERS = {"set": in_order, "lcv": lcv, "frequency": frequency}
@@ -0,0 +1,181 @@
+#! /usr/bin/python
+
+#  Incremental board for interactive play and hints
+#
+#  An IncrementalBoard keeps the digits placed so far and, for every row,
+#  column and box, the mask of the digits used in it. The candidates of a
+#  cell are what none of its three units uses yet, so placing or removing a
+#  digit only updates three masks and costs a few microseconds, no matter
+#  how far the game is. The board also keeps the candidates propagated by
+#  BitBoard.propagate(): place() propagates only from the placed cell, and
+#  unplace(), which can't be undone that way, leaves them to be rebuilt on
+#  the next use. (candidates() stays with the units, like pencil marks.)
+#  The more expensive reasoning is left to next_hint(), which stops at the
+#  cheapest deduction that places a digit.
+
+from collections import namedtuple
+
+from bitboard import ALL, BITS, CELL_UNITS, DIGIT, POPCOUNT, UNITS, BitBoard
+from sudoku import SudokuError
+
+# technique: the cheapest way to find the digit of cell, one of
+#   "mistake"       a placed digit differs from the solution
+#   "naked_single"  the cell has a single candidate
+#   "hidden_single" the digit fits nowhere else in one of the units
+#   "propagation"   singles and pointing/claiming (BitBoard.propagate())
+#   "techniques"    the techniques of techniques.py are needed as well
+#   "search"        only a search finds it
+#   "contradiction" the board has no solution (cell and digit are None)
+Hint = namedtuple("Hint", "technique cell digit")
+
+def _index(cell):
+    """ the index of a (row, col) cell, see Sudoku.table """
+    row, col = cell
+    if not (0 <= row < 9 and 0 <= col < 9):
+        raise SudokuError("No such cell: {!r}".format(cell))
+    return row*9 + col
+
+def _cell(index):
+    return divmod(index, 9)
+
+class IncrementalBoard(object):
+    """ A puzzle being played: place() and unplace() digits, ask for the
+    candidates() of a cell or for the next_hint(). Cells are (row, col)
+    pairs like the keys of Sudoku.table. The givens of the 81 character
+    puzzle can't be unplaced. """
+
+    def __init__(self, puzzle):
+        if len(puzzle) < 81:
+            raise SudokuError("An 81 character puzzle string is needed.")
+        self.digits = [0]*81
+        self.used = [0]*len(UNITS) # mask of the digits placed in every unit
+        self.givens = set()
+        # the propagated masks, False for a contradiction, None if stale
+        self._propagated = None
+        for i, char in enumerate(puzzle[:81]):
+            if char not in "0.":
+                self.place(_cell(i), int(char))
+                self.givens.add(i)
+        # the solution, if there is exactly one, for spotting mistakes
+        self.solution = None
+        board = BitBoard(self.masks())
+        if board.count(2) == 1:
+            board.solve()
+            self.solution = [DIGIT[mask] for mask in board.cells]
+
+    def mask(self, i):
+        """ candidate mask of the cell with index i """
+        if self.digits[i]:
+            return 1 << (self.digits[i]-1)
+        u0, u1, u2 = CELL_UNITS[i]
+        used = self.used
+        return ALL & ~(used[u0] | used[u1] | used[u2])
+
+    def masks(self):
+        return [self.mask(i) for i in xrange(81)]
+
+    def candidates(self, cell):
+        """ the digits that can go into cell (a tuple) """
+        return tuple(DIGIT[bit] for bit in BITS[self.mask(_index(cell))])
+
+    def place(self, cell, digit):
+        """ puts digit into an empty cell, complains if a unit of the cell
+        already has it """
+        i = _index(cell)
+        if self.digits[i]:
+            raise SudokuError("Cell {!r} is not empty.".format(cell))
+        if not 1 <= digit <= 9 or not self.mask(i) & (1 << (digit-1)):
+            raise SudokuError("{!s} can't go into {!r}.".format(digit, cell))
+        bit = 1 << (digit-1)
+        self.digits[i] = digit
+        for u in CELL_UNITS[i]:
+            self.used[u] |= bit
+        propagated = self._propagated
+        if propagated:
+            # a digit only adds constraints, so propagating from the cell is
+            # enough to get where propagating from scratch would get
+            if propagated[i] & bit:
+                board = BitBoard(propagated)
+                board.cells[i] = bit
+                self._propagated = board.propagate(queue=[i]) and board.cells
+            else: # propagation had ruled the digit out
+                self._propagated = False
+
+    def unplace(self, cell):
+        """ empties a cell that isn't a given, returns the digit it had """
+        i = _index(cell)
+        if i in self.givens:
+            raise SudokuError("Cell {!r} is a given.".format(cell))
+        digit = self.digits[i]
+        if digit:
+            self.digits[i] = 0
+            notbit = ~(1 << (digit-1))
+            for u in CELL_UNITS[i]:
+                self.used[u] &= notbit
+            self._propagated = None
+        return digit
+
+    def propagated(self):
+        """ the candidate masks of the cells after BitBoard.propagate(), or
+        False if it runs into a contradiction """
+        if self._propagated is None:
+            board = BitBoard(self.masks())
+            self._propagated = board.propagate() and board.cells
+        return self._propagated
+
+    def is_solved(self):
+        return all(self.digits)
+
+    def to_str(self):
+        return "".join(str(digit) for digit in self.digits)
+
+    def next_hint(self):
+        """ The cheapest deduction that places a digit, as a Hint (see its
+        techniques above, cheapest first), or None if the board is full. """
+        if self.is_solved():
+            return None
+        digits = self.digits
+        if self.solution:
+            for i, digit in enumerate(digits):
+                if digit and digit != self.solution[i]:
+                    return Hint("mistake", _cell(i), self.solution[i])
+        masks = self.masks()
+        for i, mask in enumerate(masks):
+            if not mask:
+                return Hint("contradiction", None, None)
+            if not digits[i] and POPCOUNT[mask] == 1:
+                return Hint("naked_single", _cell(i), DIGIT[mask])
+        for unit in UNITS:
+            once = twice = 0 # digits seen once / more than once in the unit
+            for i in unit:
+                if not digits[i]:
+                    twice |= once & masks[i]
+                    once |= masks[i]
+            for bit in BITS[once & ~twice]:
+                for i in unit:
+                    if not digits[i] and masks[i] & bit:
+                        return Hint("hidden_single", _cell(i), DIGIT[bit])
+        propagated = self.propagated()
+        if not propagated:
+            return Hint("contradiction", None, None)
+        board = BitBoard(propagated)
+        hint = self._placed(board, "propagation")
+        if hint:
+            return hint
+        from techniques import TECHNIQUES
+        board.use_techniques(TECHNIQUES)
+        if not board.propagate():
+            return Hint("contradiction", None, None)
+        hint = self._placed(board, "techniques")
+        if hint:
+            return hint
+        if not board.solve():
+            return Hint("contradiction", None, None)
+        return self._placed(board, "search")
+
+    def _placed(self, board, technique):
+        """ a Hint for the first empty cell the board has filled in """
+        for i, mask in enumerate(board.cells):
+            if not self.digits[i] and POPCOUNT[mask] == 1:
+                return Hint(technique, _cell(i), DIGIT[mask])
+        return None
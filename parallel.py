@@ -0,0 +1,183 @@
+#! /usr/bin/python
+
+#  Process pool for solving sudoku collections on every core
+#
+#  Puzzles travel to the workers and back as 81 character strings (see
+#  Sudoku.read_str() and Sudoku.to_str()), which are much cheaper to pickle
+#  than Sudoku objects.
+#
+#  solve_branches() and count_branches() put the pool to work on a single
+#  hard puzzle instead: the branches of the first levels of Sudoku.bt() are
+#  sent to the workers as candidate tables.
+
+import os
+import time
+
+from multiprocessing import Pool, cpu_count
+from sudoku import Sudoku, SudokuChild
+
+def solve_one(job):
+    """ Worker function: solves a (puzzle string, engine) pair and returns
+    (solution string, solved, worker pid, seconds spent). """
+    puzzle, engine = job
+    before = time.time()
+    sudoku = Sudoku(instr=puzzle)
+    solved = sudoku.solve(engine)
+    return sudoku.to_str(), solved, os.getpid(), time.time()-before
+
+def classify_one(job):
+    """ Worker function: Sudoku.classify() of a (puzzle string, engine)
+    pair """
+    puzzle, engine = job
+    return Sudoku(instr=puzzle).classify(engine)
+
+class PoolReport(object):
+    """ Timing of a solve_parallel() run: wall clock time of the whole run
+    and the number of puzzles solved / seconds spent by every worker. """
+
+    def __init__(self, workers, chunksize):
+        self.workers = workers
+        self.chunksize = chunksize
+        self.per_worker = {} # pid -> [puzzles, seconds]
+        self.total = 0
+        self.elapsed = 0.0
+
+    def add(self, pid, seconds):
+        stats = self.per_worker.setdefault(pid, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        self.total += 1
+
+    def throughput(self):
+        """ puzzles solved per wall clock second """
+        if not self.elapsed:
+            return 0.0
+        return self.total/self.elapsed
+
+    def __str__(self):
+        out = "Solved {!s} puzzles with {!s} workers (chunksize {!s}) in {:.3f} secs, {:.1f} puzzles/sec\n".format(
+            self.total, self.workers, self.chunksize, self.elapsed, self.throughput())
+        for pid, (count, seconds) in sorted(self.per_worker.iteritems()):
+            out += "  worker {!s}: {!s} puzzles, {:.3f} secs busy\n".format(pid, count, seconds)
+        return out
+
+def solve_parallel(puzzles, engine="classic", workers=None, chunksize=16):
+    """ Solves an iterable of 81 character puzzle strings in a pool of workers
+    processes (one per core by default, or with workers=0). The puzzles are
+    sent to the workers in chunks of chunksize. Returns a list of (solution
+    string, solved) pairs in the order of the input, and a PoolReport. """
+    workers = workers or cpu_count()
+    report = PoolReport(workers, chunksize)
+    results = []
+    pool = Pool(workers)
+    try:
+        before = time.time()
+        jobs = ((puzzle, engine) for puzzle in puzzles)
+        for solution, solved, pid, seconds in pool.imap(solve_one, jobs, chunksize):
+            report.add(pid, seconds)
+            results.append((solution, solved))
+        report.elapsed = time.time()-before
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results, report
+
+def classify_parallel(puzzles, engine="classic", workers=None, chunksize=16):
+    """ Returns the Sudoku.classify() tag of every puzzle string, in the
+    order of the input, computed by a pool of workers processes """
+    pool = Pool(workers or cpu_count())
+    try:
+        jobs = ((puzzle, engine) for puzzle in puzzles)
+        tags = list(pool.imap(classify_one, jobs, chunksize))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return tags
+
+def expand(sudoku, depth=1):
+    """ Splits a puzzle that Sudoku.propagate() got stuck on into the branches
+    of the first depth levels of Sudoku.bt(). Returns the list of children
+    solved on the way and the list of the open (consistent but unsolved)
+    children at depth. """
+    solved, frontier = [], [sudoku]
+    for _ in xrange(depth):
+        children = []
+        for parent in frontier:
+            for child in parent.branches():
+                if child.propagate():
+                    solved.append(child)
+                elif child.is_consistent():
+                    children.append(child)
+        frontier = children
+    return solved, frontier
+
+def solve_branch(job):
+    """ Worker function: solves a (table, solve1 visited, heuristics) branch,
+    returns the solved table or None """
+    table, visited, heuristics = job
+    child = SudokuChild(table, visited, heuristics=heuristics)
+    if child.solve():
+        return child.table
+    return None
+
+def count_branch(job):
+    """ Worker function: counts the solutions of a (table, solve1 visited,
+    limit, heuristics) branch """
+    table, visited, limit, heuristics = job
+    child = SudokuChild(table, visited, heuristics=heuristics)
+    return child.bt_count(limit)
+
+def solve_branches(sudoku, workers=None, depth=1):
+    """ Speculative backtracking for Sudoku.bt(): the branches of the first
+    depth levels are solved concurrently in a pool of workers processes
+    (workers=None or 0 uses every core). The first branch to find a solution
+    wins, its table is copied to sudoku.table and the pool is terminated,
+    which cancels the other branches. Returns True if a solution was found. """
+    solved, frontier = expand(sudoku, depth)
+    if solved:
+        sudoku.table = solved[0].table
+        sudoku.count_cells()
+        return True
+    if not frontier:
+        return False
+    jobs = [(child.table, child._solve1_visited, child.heuristics)
+        for child in frontier]
+    pool = Pool(workers or cpu_count())
+    try:
+        for table in pool.imap_unordered(solve_branch, jobs):
+            if table is not None:
+                sudoku.table = table
+                sudoku.count_cells()
+                return True
+        return False
+    finally:
+        pool.terminate()
+        pool.join()
+
+def count_branches(sudoku, limit=None, workers=None, depth=1):
+    """ The counting counterpart of solve_branches() for Sudoku.bt_count():
+    sums the solution counts of the branches, and cancels the rest once
+    limit (if given) is reached. """
+    solved, frontier = expand(sudoku, depth)
+    count = len(solved)
+    if frontier and (limit is None or count < limit):
+        jobs = [(child.table, child._solve1_visited, limit, child.heuristics)
+            for child in frontier]
+        pool = Pool(workers or cpu_count())
+        try:
+            for branch_count in pool.imap_unordered(count_branch, jobs):
+                count += branch_count
+                if limit is not None and count >= limit:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+    if limit is not None:
+        return min(count, limit)
+    return count
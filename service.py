@@ -0,0 +1,314 @@
+#! /usr/bin/python
+
+#  Resident solver service
+#
+#  Starting sudoku.py for every puzzle pays for the interpreter start and
+#  for building the class tables every time. The service keeps one process
+#  (and optionally a pool of workers) warm and takes puzzles over localhost
+#  HTTP or a Unix socket:
+#
+#      ./service.py --port 8081 --engine bitmask --workers 4
+#      curl --data-binary @puzzles/hard_puzzles_95.txt localhost:8081/solve
+#      curl localhost:8081/metrics
+#
+#      ./service.py --socket /tmp/sudoku.sock
+#
+#  A request is any number of 9x9 puzzles, one per line. The answer has a line
+#  for every puzzle: the solution, "invalid" or "timeout". On the Unix
+#  socket a request ends with an empty line (or the end of the input), and
+#  the line "metrics" is answered with the metrics as JSON. A request the
+#  queue has no room for is answered with the single line "busy".
+#
+#  Puzzles of concurrent requests are queued and solved in micro-batches:
+#  the dispatcher thread takes whatever is waiting (at most batch_size
+#  puzzles, waiting at most batch_wait seconds for more) and solves it in
+#  one go, in a process pool if there are workers. Every puzzle is solved
+#  on the deadline of its request (see budget.py) and given up as "timeout"
+#  when it runs out, so a slow puzzle can't hold up the batches behind it.
+#  A full queue rejects new requests (HTTP 503, "busy" on the socket)
+#  instead of letting the latency grow without bound.
+
+import json
+import os
+import socket
+import threading
+import time
+import urllib2
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from Queue import Empty, Full, Queue
+from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+
+from benchmark import percentile
+from sudoku import BUDGET_EXCEEDED, Sudoku
+
+INVALID, TIMEOUT, BUSY = "invalid", "timeout", "busy"
+
+class ServiceBusy(Exception):
+    """ raised when the queue of the service is full """
+    pass
+
+def solve_job(job):
+    """ Worker function: solves a (puzzle string, engine, deadline) job,
+    returns the solution, INVALID or TIMEOUT if the deadline (a time.time()
+    value) passes first """
+    puzzle, engine, deadline = job
+    if len(puzzle) != 81 or not puzzle.isdigit():
+        return INVALID
+    if time.time() >= deadline: # expired while it waited for a worker
+        return TIMEOUT
+    sudoku = Sudoku(instr=puzzle)
+    solved = sudoku.solve(engine, deadline=deadline)
+    if solved is BUDGET_EXCEEDED:
+        return TIMEOUT
+    if solved and sudoku.is_solved():
+        return sudoku.to_str()
+    return INVALID
+
+class Job(object):
+    """ A puzzle waiting in the queue of the service """
+    __slots__ = ("puzzle", "deadline", "done", "result")
+
+    def __init__(self, puzzle, deadline):
+        self.puzzle = puzzle
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result = TIMEOUT
+
+class SolverService(object):
+    """ Solves puzzles handed over by any number of threads in micro-batches.
+    start() launches the dispatcher (and the pool of workers processes, if
+    workers isn't 1), stop() shuts them down. solve() blocks until the
+    puzzles are solved or timeout seconds are over. At most max_pending
+    puzzles can wait in the queue. """
+
+    def __init__(self, engine="bitmask", workers=1, batch_size=64,
+            batch_wait=0.002, max_pending=10000, timeout=10.0):
+        self.engine = engine
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.queue = Queue(max_pending)
+        self.pool = None
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=10000) # seconds, of the latest requests
+        self.started = time.time()
+        self.requests = self.puzzles = self.invalid = self.timeouts = 0
+        self.rejected = self.batches = 0
+
+    def start(self):
+        # solve a puzzle to build the class tables of Sudoku in this process
+        solve_job(("0"*81, self.engine, time.time() + 60))
+        if self.workers != 1:
+            from multiprocessing import Pool, cpu_count
+            self.pool = Pool(self.workers or cpu_count())
+        self.running = True
+        self.thread = threading.Thread(target=self.dispatch)
+        self.thread.daemon = True
+        self.thread.start()
+        self.started = time.time()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+
+    def solve(self, puzzles, timeout=None):
+        """ Queues the puzzles and returns the list of their results (the
+        solution, INVALID or TIMEOUT). Raises ServiceBusy if the queue
+        can't take all of them. """
+        before = time.time()
+        deadline = before + (self.timeout if timeout is None else timeout)
+        jobs = [Job(puzzle, deadline) for puzzle in puzzles]
+        for job in jobs:
+            try:
+                self.queue.put_nowait(job)
+            except Full:
+                for queued in jobs: # the queued ones are skipped as expired
+                    queued.deadline = 0
+                with self.lock:
+                    self.rejected += 1
+                raise ServiceBusy("The queue of the service is full.")
+        for job in jobs:
+            job.done.wait(max(deadline - time.time(), 0))
+        results = [job.result for job in jobs]
+        with self.lock:
+            self.requests += 1
+            self.puzzles += len(jobs)
+            self.invalid += results.count(INVALID)
+            self.timeouts += results.count(TIMEOUT)
+            self.latencies.append(time.time() - before)
+        return results
+
+    def dispatch(self):
+        """ The dispatcher thread: takes batches off the queue and solves
+        them. Jobs whose deadline has passed are skipped, the others are
+        solved on their deadline, so a batch never takes longer than its
+        latest one. """
+        while self.running:
+            try:
+                batch = [self.queue.get(timeout=0.1)]
+            except Empty:
+                continue
+            end = time.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(end - time.time(), 0)))
+                except Empty:
+                    break
+            now = time.time()
+            batch = [job for job in batch if job.deadline > now]
+            jobs = [(job.puzzle, self.engine, job.deadline) for job in batch]
+            if self.pool:
+                results = self.pool.map(solve_job, jobs)
+            else:
+                results = map(solve_job, jobs)
+            for job, result in zip(batch, results):
+                job.result = result
+                job.done.set()
+            with self.lock:
+                self.batches += 1
+
+    def metrics(self):
+        """ counters, request latency percentiles and throughput as a dict """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            uptime = time.time() - self.started
+            return {"engine": self.engine, "workers": self.workers,
+                "uptime": uptime, "requests": self.requests,
+                "puzzles": self.puzzles, "invalid": self.invalid,
+                "timeouts": self.timeouts, "rejected": self.rejected,
+                "batches": self.batches, "pending": self.queue.qsize(),
+                "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "puzzles_per_sec": self.puzzles/uptime if uptime else 0.0}
+
+def read_request(lines):
+    """ the puzzles of a request, one per non empty line """
+    return [line.strip() for line in lines if line.strip()]
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """ POST /solve with newline delimited puzzles, GET /metrics """
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            return self.send_error(404)
+        self.reply(200, json.dumps(self.server.service.metrics(), sort_keys=True))
+
+    def do_POST(self):
+        if self.path != "/solve":
+            return self.send_error(404)
+        length = int(self.headers.getheader("Content-Length") or 0)
+        puzzles = read_request(self.rfile.read(length).splitlines())
+        try:
+            results = self.server.service.solve(puzzles)
+        except ServiceBusy as e:
+            return self.send_error(503, str(e))
+        self.reply(200, "".join(result + "\n" for result in results))
+
+    def reply(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # the metrics tell more than a line per request
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class UnixHandler(StreamRequestHandler):
+    """ line protocol of the Unix socket, see the top of the module """
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            lines = []
+            for line in iter(self.rfile.readline, ""):
+                if not line.strip():
+                    break
+                if line.strip() == "metrics":
+                    self.wfile.write(json.dumps(service.metrics(), sort_keys=True) + "\n")
+                    continue
+                lines.append(line)
+            else:
+                if not lines:
+                    return # end of the input
+            try:
+                results = service.solve(read_request(lines))
+            except ServiceBusy:
+                results = [BUSY]
+            self.wfile.write("".join(result + "\n" for result in results) + "\n")
+            self.wfile.flush()
+
+class ThreadingUnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, port=None, path=None, host="localhost"):
+    """ An HTTP server on host:port, or a Unix socket server on path, for
+    service. port=0 picks a free port (see server.server_address). Call
+    serve_forever() on it. """
+    if path is not None:
+        if os.path.exists(path):
+            os.remove(path)
+        server = ThreadingUnixServer(path, UnixHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), HTTPHandler)
+    server.service = service
+    return server
+
+def http_client(puzzles, url="http://localhost:8081"):
+    """ solves puzzles through the HTTP API of a service """
+    body = "".join(puzzle + "\n" for puzzle in puzzles)
+    return urllib2.urlopen(url + "/solve", body).read().splitlines()
+
+def unix_client(puzzles, path):
+    """ solves puzzles through the Unix socket of a service """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    try:
+        client.sendall("".join(puzzle + "\n" for puzzle in puzzles) + "\n")
+        client.shutdown(socket.SHUT_WR)
+        answer = client.makefile().read()
+    finally:
+        client.close()
+    return answer.splitlines()[:len(puzzles)]
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku solver service")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--socket", metavar="PATH",
+        help="listen on a Unix socket instead of HTTP")
+    parser.add_argument("--engine", default="bitmask",
+        choices=["classic"] + sorted(Sudoku.engines))
+    parser.add_argument("--workers", type=int, default=1,
+        help="size of the process pool, 0 uses every core")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batch-wait", type=float, default=0.002,
+        help="seconds to wait for a batch to fill up")
+    parser.add_argument("--max-pending", type=int, default=10000,
+        help="puzzles that can wait before requests are rejected")
+    parser.add_argument("--timeout", type=float, default=10.0,
+        help="seconds a request may take")
+    args = parser.parse_args()
+    service = SolverService(args.engine, args.workers, args.batch_size,
+        args.batch_wait, args.max_pending, args.timeout)
+    service.start()
+    server = make_server(service, args.port, args.socket, args.host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
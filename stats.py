@@ -0,0 +1,79 @@
+#! /usr/bin/python
+
+#  Search statistics of the sudoku solver
+#
+#  A SolveStats object is only filled in when it is handed to Sudoku.solve(),
+#  otherwise the solvers skip the bookkeeping altogether.
+
+from collections import defaultdict
+
+class SolveStats(object):
+    """ What a solve did:
+
+    iterations    rounds of Sudoku.repeat_until_stuck()
+    calls         solver name -> number of calls
+    eliminations  solver (or technique) name -> candidates removed
+    nodes         branches tried by the backtracking
+    max_depth     deepest level of backtracking reached
+    dead_ends     branches that turned out to be inconsistent
+    budget_exceeded  solves that ran out of their budget (see budget.py)
+    times         phase ("solve1", "solve2", "solve3", "search", "total")
+                  -> seconds spent in it. "search" is the whole backtracking,
+                  including the solver calls made inside it.
+    """
+
+    def __init__(self, puzzle=None, count=1):
+        self.puzzle = puzzle
+        self.solved = None
+        self.iterations = 0
+        self.calls = defaultdict(int)
+        self.eliminations = defaultdict(int)
+        self.nodes = 0
+        self.max_depth = 0
+        self.dead_ends = 0
+        self.budget_exceeded = 0
+        self.times = defaultdict(float)
+        self.count = count # number of solves aggregated in this object,
+                           # 0 for an empty aggregate
+
+    def add(self, other):
+        """ aggregates the statistics of another solve into this one """
+        self.iterations += other.iterations
+        for name, calls in other.calls.iteritems():
+            self.calls[name] += calls
+        for name, eliminations in other.eliminations.iteritems():
+            self.eliminations[name] += eliminations
+        self.nodes += other.nodes
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.dead_ends += other.dead_ends
+        self.budget_exceeded += other.budget_exceeded
+        for phase, seconds in other.times.iteritems():
+            self.times[phase] += seconds
+        self.count += other.count
+
+    def as_dict(self):
+        return {"puzzle": self.puzzle, "solved": self.solved,
+            "iterations": self.iterations, "calls": dict(self.calls),
+            "eliminations": dict(self.eliminations), "nodes": self.nodes,
+            "max_depth": self.max_depth, "dead_ends": self.dead_ends,
+            "budget_exceeded": self.budget_exceeded,
+            "times": dict(self.times), "count": self.count}
+
+    def to_json(self):
+        """ a single line of JSON """
+        import json
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def summary(self):
+        """ human readable summary """
+        out = "{!s} solves: {!s} iterations, {!s} nodes, max depth {!s}, {!s} dead ends\n".format(
+            self.count, self.iterations, self.nodes, self.max_depth, self.dead_ends)
+        if self.budget_exceeded:
+            out += "  {!s} over budget\n".format(self.budget_exceeded)
+        for name in sorted(set(self.calls) | set(self.eliminations)):
+            out += "  {!s}: {!s} calls, {!s} eliminations, {:.4f} secs\n".format(
+                name, self.calls.get(name, 0), self.eliminations.get(name, 0),
+                self.times.get(name, 0.0))
+        for phase in ("search", "total"):
+            out += "  {!s}: {:.4f} secs\n".format(phase, self.times.get(phase, 0.0))
+        return out
@@ -0,0 +1,302 @@
+#! /usr/bin/python
+
+#  Memory-mapped puzzle store for random access into huge collections
+#
+#  SudokuCollection reads a whole file into Sudoku objects before anything
+#  else can happen. A PuzzleStore memory-maps the file instead and finds
+#  any puzzle in O(1), so store[37000000] only touches the pages of that
+#  puzzle. It takes two formats:
+#
+#  - text, one puzzle per line like the files in puzzles/. The offsets of
+#    the puzzle lines are kept in an index file next to it (FILE.idx),
+#    built on first use and rebuilt when the puzzle file changes.
+#
+#  - packed: a header and 41 bytes for every 9x9 puzzle, the 81 cells as
+#    nibbles (0 is an empty cell, the last nibble is padding). Records have
+#    a fixed size, so no index is needed. Write one with pack():
+#
+#      ./store.py pack puzzles/hard_puzzles_95.txt hard_95.sdk
+#      ./store.py get hard_95.sdk 17
+#
+#  Slices and shards of a store are views sharing its memory map. They
+#  pickle as the path and the range, so a worker process that gets one maps
+#  the file on its own and reads its range without anything being copied.
+
+import binascii
+import mmap
+import os
+import struct
+
+from sudoku import BOARD_SIZES, Sudoku, SudokuError
+
+PACKED_MAGIC = "SUDOKU41" # the header of the packed format
+RECORD_SIZE = 41 # bytes of a packed 9x9 puzzle
+
+# the header of an index file: magic, size and mtime of the puzzle file
+INDEX_MAGIC = "SUDOKUIX"
+INDEX_HEADER = struct.Struct("<8sQd")
+OFFSET = struct.Struct("<Q")
+
+def pack_puzzle(puzzle):
+    """ the 41 byte record of an 81 character puzzle string of digits ("0"
+    or "." for an empty cell) """
+    if len(puzzle) != 81 or not puzzle.replace(".", "0").isdigit():
+        raise SudokuError("Only 9x9 puzzles of digits can be packed: {!r}".format(puzzle))
+    return binascii.unhexlify(puzzle.replace(".", "0") + "0")
+
+def unpack_puzzle(record):
+    """ the 81 character puzzle string of a 41 byte record """
+    return binascii.hexlify(record)[:81]
+
+def pack(puzzles, outfile):
+    """ Writes puzzles (81 character strings) to outfile in the packed
+    format. Returns the number of puzzles written. Every puzzle is packed
+    before anything is written, so a puzzle that can't be packed (see
+    pack_puzzle()) leaves outfile as it was. """
+    records = [pack_puzzle(puzzle) for puzzle in puzzles]
+    outfile.write(PACKED_MAGIC)
+    for record in records:
+        outfile.write(record)
+    return len(records)
+
+def _map(path):
+    """ the read only memory map of a file ("" for an empty file) """
+    with open(path, "rb") as infile:
+        if not os.fstat(infile.fileno()).st_size:
+            return ""
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+def build_index(path, index_path=None):
+    """ Writes the index of the text puzzle file path: the offset of every
+    line SudokuCollection would read (81, 256 or 625 characters without the
+    surrounding whitespace). The index is written to a temporary file and
+    renamed, so a reader never sees half of it. Returns the number of
+    puzzles. """
+    index_path = index_path or path + ".idx"
+    info = os.stat(path)
+    data = _map(path)
+    find, size = data.find, len(data)
+    temp = "{!s}.{!s}.tmp".format(index_path, os.getpid())
+    count = 0
+    try:
+        with open(temp, "wb") as outfile:
+            outfile.write(INDEX_HEADER.pack(INDEX_MAGIC, info.st_size, info.st_mtime))
+            offsets = []
+            start = 0
+            while start < size:
+                end = find("\n", start)
+                if end < 0:
+                    end = size
+                line = data[start:end]
+                if len(line.strip()) in BOARD_SIZES:
+                    offsets.append(start)
+                    if len(offsets) == 65536:
+                        outfile.write(struct.pack("<{!s}Q".format(len(offsets)), *offsets))
+                        count += len(offsets)
+                        offsets = []
+                start = end + 1
+            outfile.write(struct.pack("<{!s}Q".format(len(offsets)), *offsets))
+            count += len(offsets)
+        os.rename(temp, index_path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+        if data:
+            data.close()
+    return count
+
+def _index_is_current(path, index_path):
+    """ whether index_path is an index of the current contents of path """
+    try:
+        with open(index_path, "rb") as infile:
+            header = infile.read(INDEX_HEADER.size)
+    except IOError:
+        return False
+    if len(header) != INDEX_HEADER.size:
+        return False
+    magic, size, mtime = INDEX_HEADER.unpack(header)
+    info = os.stat(path)
+    return magic == INDEX_MAGIC and size == info.st_size and mtime == info.st_mtime
+
+class PuzzleStore(object):
+    """ Random access to the puzzles of a text or packed file (see the top
+    of the module): len(), store[i] (the puzzle string), slices and shards
+    (views of the store), iteration. A text file gets its index built if
+    it has none, or only a stale one. """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.data = _map(path)
+        self.packed = self.data[:len(PACKED_MAGIC)] == PACKED_MAGIC
+        if self.packed:
+            self.index = None
+            total = (len(self.data) - len(PACKED_MAGIC)) // RECORD_SIZE
+        else:
+            if not _index_is_current(path, self.index_path):
+                build_index(path, self.index_path)
+            self.index = _map(self.index_path)
+            total = (len(self.index) - INDEX_HEADER.size) // OFFSET.size
+        self.start, self.step, self.length = 0, 1, total
+        self.owner = True # views leave the maps to the store they came from
+
+    def close(self):
+        if not self.owner:
+            return
+        for data in (self.data, self.index):
+            if data:
+                data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.length
+
+    def puzzle(self, position):
+        """ the puzzle at position in the whole file, ignoring the view """
+        if self.packed:
+            offset = len(PACKED_MAGIC) + position*RECORD_SIZE
+            return unpack_puzzle(self.data[offset:offset+RECORD_SIZE])
+        (offset,) = OFFSET.unpack_from(self.index, INDEX_HEADER.size + position*OFFSET.size)
+        end = self.data.find("\n", offset)
+        return self.data[offset:end if end >= 0 else len(self.data)].strip()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            return self.view(self.start + start*self.step, self.step*step,
+                len(xrange(start, stop, step)))
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError("PuzzleStore index out of range")
+        return self.puzzle(self.start + key*self.step)
+
+    def __iter__(self):
+        for i in xrange(self.length):
+            yield self.puzzle(self.start + i*self.step)
+
+    def view(self, start, step, length):
+        """ a store sharing the memory map of this one, for length puzzles
+        from position start of the file on, step apart """
+        view = object.__new__(PuzzleStore)
+        view.__dict__.update(self.__dict__)
+        view.start, view.step, view.length = start, step, length
+        view.owner = False
+        return view
+
+    def shard(self, number, count):
+        """ the number-th (0 based) of count disjoint contiguous views that
+        cover the store, their sizes differ by 1 at most """
+        if not 0 <= number < count:
+            raise SudokuError("No shard {!s} of {!s}.".format(number, count))
+        return self[self.length*number//count:self.length*(number+1)//count]
+
+    def shards(self, count):
+        return [self.shard(number, count) for number in xrange(count)]
+
+    def sudoku(self, i):
+        """ store[i] as a Sudoku """
+        return Sudoku(instr=self[i])
+
+    def __getstate__(self):
+        return {"path": self.path, "index_path": self.index_path,
+            "range": (self.start, self.step, self.length)}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["index_path"])
+        self.start, self.step, self.length = state["range"]
+
+def solve_shard(job):
+    """ Worker function: the (solution string, solved) pairs of every
+    puzzle of a (store view, engine) job """
+    from stream import solve_lines
+    shard, engine = job
+    try:
+        return list(solve_lines(shard, engine))
+    finally:
+        shard.close()
+
+def solve_store(store, outfile, engine="classic", workers=1, shards=None):
+    """ Solves every puzzle of store and writes the solutions to outfile in
+    order, one per line. With workers other than 1 (0 uses every core) the
+    store is cut into shards (4 per worker by default) and every worker
+    reads its shards from the file itself. Returns the number of puzzles
+    and the number of bogus puzzles. """
+    from stream import solve_lines
+    if workers == 1:
+        results = [solve_lines(store, engine)]
+        pool = None
+    else:
+        from multiprocessing import Pool, cpu_count
+        workers = workers or cpu_count()
+        pool = Pool(workers)
+        jobs = [(shard, engine) for shard in store.shards(shards or 4*workers)]
+        results = pool.imap(solve_shard, jobs)
+    total = bogus = 0
+    try:
+        for shard_results in results:
+            for solution, solved in shard_results:
+                outfile.write(solution + "\n")
+                total += 1
+                bogus += not solved
+        if pool:
+            pool.close()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.join()
+    outfile.flush()
+    return total, bogus
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from stream import open_puzzles, iter_puzzles
+    parser = argparse.ArgumentParser(description="Memory-mapped puzzle store")
+    commands = parser.add_subparsers(dest="command")
+    command = commands.add_parser("index", help="build the index of a text puzzle file")
+    command.add_argument("path")
+    command = commands.add_parser("pack", help="write the 9x9 puzzles of a "
+        "file (.gz or - work too) in the packed format")
+    command.add_argument("path")
+    command.add_argument("output")
+    command = commands.add_parser("get", help="print puzzles by position, "
+        "e.g. 17 or 100:200")
+    command.add_argument("path")
+    command.add_argument("positions")
+    command = commands.add_parser("solve", help="solve every puzzle of a store")
+    command.add_argument("path")
+    command.add_argument("--engine", default="classic",
+        choices=["classic"] + sorted(Sudoku.engines))
+    command.add_argument("--workers", type=int, default=1,
+        help="size of the process pool, 0 uses every core")
+    args = parser.parse_args()
+    if args.command == "index":
+        print "{!s} puzzles".format(build_index(args.path))
+    elif args.command == "pack":
+        infile = open_puzzles(args.path)
+        with open(args.output, "wb") as outfile:
+            count = pack((puzzle for puzzle in iter_puzzles(infile)
+                if len(puzzle) == 81), outfile)
+        print "{!s} puzzles".format(count)
+    elif args.command == "get":
+        with PuzzleStore(args.path) as store:
+            if ":" in args.positions:
+                key = slice(*[int(n) if n else None for n in args.positions.split(":")])
+                for puzzle in store[key]:
+                    print puzzle
+            else:
+                print store[int(args.positions)]
+    else:
+        with PuzzleStore(args.path) as store:
+            total, bogus = solve_store(store, sys.stdout, args.engine, args.workers)
+        if bogus:
+            sys.stderr.write("Warning: {!s} bogus puzzles out of {!s}.\n".format(bogus, total))
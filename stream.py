@@ -0,0 +1,130 @@
+#! /usr/bin/python
+
+#  Streaming solver for puzzle files of any size
+#
+#  Unlike SudokuCollection, which builds a Sudoku object for every line of
+#  the file before it starts solving, solve_stream() reads, solves and writes
+#  one batch of lines at a time, so its memory use doesn't depend on the size
+#  of the input.
+
+import gzip
+import sys
+
+from itertools import islice
+from stats import SolveStats
+from sudoku import BOARD_SIZES, Sudoku, SudokuError
+
+def open_puzzles(path, mode="r"):
+    """ Opens a puzzle file. "-" stands for stdin (or stdout when writing or
+    appending), files ending in .gz are (de)compressed on the fly. """
+    if path == "-":
+        return sys.stdin if mode.startswith("r") else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "b")
+    return open(path, mode)
+
+def iter_puzzles(infile):
+    """ Yields the puzzle descriptions of infile, one string of 81, 256 or
+    625 characters per line. Other lines are skipped, just like in
+    SudokuCollection. """
+    for line in infile:
+        description = line.strip()
+        if len(description) in BOARD_SIZES:
+            yield description
+
+def solve_lines(puzzles, engine="classic", stats=None, statsfile=None):
+    """ Yields (solution string, solved) for every puzzle string. If an
+    aggregate stats.SolveStats is given, the statistics of every solve are
+    added to it and written to statsfile (if given) as a line of JSON. """
+    for puzzle in puzzles:
+        sudoku = Sudoku(instr=puzzle)
+        if stats is None:
+            solved = sudoku.solve(engine)
+        else:
+            puzzle_stats = SolveStats()
+            solved = sudoku.solve(engine, stats=puzzle_stats)
+            stats.add(puzzle_stats)
+            if statsfile:
+                statsfile.write(puzzle_stats.to_json() + "\n")
+        yield sudoku.to_str(), solved
+
+def solve_stream(infile, outfile, engine="classic", batch_size=1000,
+        workers=1, chunksize=16, stats=None, statsfile=None,
+        checkpoint=None, shard=None):
+    """ Solves every puzzle of infile and writes the solutions to outfile,
+    one line each, in the order of the input. Lines are read, solved and
+    written in batches of batch_size. With workers other than 1 each batch
+    is solved in a process pool (see parallel.solve_parallel()). stats and
+    statsfile are passed on to solve_lines(), they can't be used with a
+    pool. With a checkpoint (a path) the progress is saved after every
+    batch and a run with an existing checkpoint resumes from it: infile is
+    read from the offset it records and outfile (opened with "a" or "r+")
+    is truncated to the output it records, see checkpoint.py.
+    shard=(n, count) only solves the n-th of every count puzzles. Returns
+    the number of puzzles and the number of bogus puzzles (of the whole
+    run, if it was resumed). """
+    if stats is not None and workers != 1:
+        raise SudokuError("Stats are only collected without workers.")
+    progress = None
+    if checkpoint or shard:
+        from checkpoint import CheckpointedOutput, read_positions
+        position = offset = 0
+        if checkpoint:
+            progress = CheckpointedOutput(outfile, checkpoint, shard)
+            if progress.checkpoint.finished:
+                return progress.checkpoint.completed, progress.checkpoint.bogus
+            position = progress.checkpoint.position
+            offset = progress.checkpoint.offset
+        number, count = shard or (0, 1)
+        # (puzzle, position, offset) of the puzzles of the shard
+        puzzles = (item for item in read_positions(infile, position, offset)
+            if item[1] % count == number)
+    else:
+        puzzles = iter_puzzles(infile)
+    pool = None
+    if workers != 1:
+        from multiprocessing import Pool, cpu_count
+        from parallel import solve_one
+        pool = Pool(workers or cpu_count())
+    total = bogus = 0
+    try:
+        while True:
+            batch = list(islice(puzzles, batch_size))
+            if not batch:
+                break
+            if checkpoint or shard:
+                last = batch[-1]
+                batch = [puzzle for puzzle, _, _ in batch]
+            if pool:
+                jobs = [(puzzle, engine) for puzzle in batch]
+                results = [result[:2] for result in
+                    pool.imap(solve_one, jobs, chunksize)]
+            else:
+                results = solve_lines(batch, engine, stats, statsfile)
+            out = []
+            batch_bogus = 0
+            for solution, solved in results:
+                if not solved:
+                    batch_bogus += 1
+                out.append(solution)
+            bogus += batch_bogus
+            total += len(batch)
+            if progress:
+                progress.write(out, last[1] + 1, last[2], batch_bogus)
+                continue
+            out.append("")
+            outfile.write("\n".join(out))
+        if pool:
+            pool.close()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.join()
+    outfile.flush()
+    if progress:
+        progress.finish()
+        return progress.checkpoint.completed, progress.checkpoint.bogus
+    return total, bogus
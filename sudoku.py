@@ -7,16 +7,11 @@
 #
 #   things to try out
 #
-#      memoize helper functions (make them pure functions first)
 #      raise exception when inconsistency is detected
 #
 # - raise exception on inputs that are too long
 #
 # - implement __getitem__() on Sudoku?
-# - generate sudokus
-# - generate extremely hard sudokus (measure the time it takes for this
-# program to solve it or the amount of backtracking needed)
-# - add --verbose switch to Sudoku
 #
 # - decent output :) (gui?)
 # - memoize everything (refractor to be able to memoize functions that
@@ -29,12 +24,18 @@
 # - add diff tests for the two collections!!
 #
 
+#  Startup time matters for the CLI and for the workers of the process
+#  pools, so the other engines, copy and the decorators are only imported
+#  when they are needed, and the class tables are built on the first
+#  Sudoku() from direct formulas (see benchmark.startup_time()).
+
 import itertools
-import copy
 import sys
+import time
 
-from decorators import *
-from collections import defaultdict
+from budget import Budget, BudgetExceeded
+from heuristics import CELL_SELECTORS, VALUE_ORDERS
+from stats import SolveStats
 
 class SudokuError(Exception):
     pass
@@ -42,6 +43,35 @@ class SudokuError(Exception):
 class SudokuInputError(SudokuError):
     pass
 
+# what Sudoku.classify() tells about a puzzle
+INVALID, UNIQUE, MULTIPLE = "invalid", "unique", "multiple"
+
+class BudgetExceededResult(object):
+    """ The type of BUDGET_EXCEEDED. It is false, so code that only
+    checks whether solve() succeeded treats it as a failure. """
+    def __nonzero__(self):
+        return False
+    def __repr__(self):
+        return "BUDGET_EXCEEDED"
+
+# what Sudoku.solve() returns when it runs out of its budget
+BUDGET_EXCEEDED = BudgetExceededResult()
+
+# what SudokuCollection.solve_all() can do with a puzzle over budget
+BUDGET_POLICIES = ("skip", "retry", "report")
+
+# the sizes of the boxes of the boards Sudoku can read in: 3 for the usual
+# 9x9 board, 4 for 16x16 and 5 for 25x25
+BOX_SIZES = (3, 4, 5)
+
+# number of cells -> box size
+BOARD_SIZES = dict((size**4, size) for size in BOX_SIZES)
+
+# the symbols of the string format: digit k is written as SYMBOLS[k-1], so
+# 16x16 boards use 1-9 and A-G, 25x25 boards 1-9 and A-P (read in either
+# case). "0" or "." is an empty cell.
+SYMBOLS = "123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
 def p(string):
     print "DEBUG: {!s}".format(string)
 
@@ -55,31 +85,160 @@ class SudokuCollection(object): #TODO add __len__
         for line in sudokufile:
             # description of a single sudoku puzzle
             description = line.strip() 
-            if len(description) == 81:
+            if len(description) in BOARD_SIZES:
                 self.sudokus.append(Sudoku(instr=description))
 
-    def solve_all(self, outfile=None, verbose=True):
+    def solve_all(self, outfile=None, verbose=True, engine="classic",
+            workers=1, chunksize=16, vectorized=False, cache=None,
+            stats=False, statsfile=None, timeout=None, max_nodes=None,
+            on_budget="report", retry_engine="bitmask", checkpoint=None,
+            checkpoint_every=1000, shard=None):
         """ solves all sudokus in the collection, and (optionally) writes out 
-        the solutions to the file specified """
+        the solutions to the file specified. engine is passed on to
+        Sudoku.solve(). With workers other than 1 the puzzles are solved
+        in a process pool (workers=None or 0 uses every core), see
+        parallel.solve_parallel(). The timing of the pool is kept in
+        self.report. With vectorized=True singles are eliminated in all
+        the puzzles at once with NumPy and engine only has to finish the
+        puzzles that are left unsolved, see batch.solve_batch(). A
+        cache.SolutionCache is checked before solving any puzzle and
+        updated with the new solutions. With stats=True every puzzle is
+        solved with a stats.SolveStats object, which is written to statsfile
+        (if given) as a line of JSON; their sum is kept in self.stats and its
+        summary is printed if verbose. With a timeout (in seconds) and/or
+        max_nodes every puzzle is solved on that budget (see
+        Sudoku.solve()), and on_budget decides what happens to a puzzle
+        that runs out of it: "skip" leaves it as it is, "retry" solves it
+        again with retry_engine on a new budget and "report" warns about
+        it. The indices of the puzzles that stay over budget are kept in
+        self.exceeded. With a checkpoint (a path, see checkpoint.py) the
+        solutions are written to outfile as they come and the progress is
+        saved every checkpoint_every puzzles; if the checkpoint is there
+        already, the run resumes from it, and outfile (opened with "a" or
+        "r+") ends up as it would have without the interruption. The
+        puzzles solved before the interruption are left as they are in the
+        collection. shard=(n, count) only solves (and writes) the puzzles whose
+        index is n modulo count, see checkpoint.merge_shards(). Stats,
+        budgets, checkpoints and shards only work when the puzzles are
+        solved one by one in this process. """
         v = verbose
         total = len(self) #total number of sudokus in the collection
+        budgeted = timeout is not None or max_nodes is not None
+        if ((stats or budgeted or checkpoint or shard)
+                and (vectorized or workers != 1)):
+            raise SudokuError("Stats, budgets, checkpoints and shards only "
+                "work without workers and vectorization.")
+        if checkpoint and not outfile:
+            raise SudokuError("A checkpoint needs an outfile.")
+        if cache is not None and any(sudoku.size != 3 for sudoku in self):
+            # as in solve_cached(), for the pool and vectorized paths too
+            raise SudokuError("The solution cache only takes 9x9 puzzles.")
+        if on_budget not in BUDGET_POLICIES:
+            raise SudokuError("Unknown budget policy: {!s}".format(on_budget))
+        self.exceeded = []
+        self.stats = SolveStats(count=0) if stats else None
         if v: print "Solving {!s} sudokus.".format(total)
-        for i, sudoku in enumerate(self):
-            if v: print sudoku
-            if not sudoku.solve():
-                print "Warning: bogus puzzle."
-            if v: print sudoku
-            if v: print "{!s} out of {!s} sudokus solved.".format(i+1, total)
+        if vectorized or workers != 1:
+            puzzles = [sudoku.to_str() for sudoku in self]
+            results = [None]*total
+            if cache is not None:
+                for i, puzzle in enumerate(puzzles):
+                    solution = cache.get(puzzle)
+                    if solution is not None:
+                        results[i] = (solution, True)
+            missing = [i for i, result in enumerate(results) if result is None]
+            if vectorized:
+                from batch import solve_batch
+                solved = solve_batch([puzzles[i] for i in missing], engine)
+            else:
+                from parallel import solve_parallel
+                solved, self.report = solve_parallel(
+                    [puzzles[i] for i in missing], engine, workers, chunksize)
+                if v: print self.report
+            for i, result in itertools.izip(missing, solved):
+                results[i] = result
+                if cache is not None and result[1]:
+                    cache.put(puzzles[i], result[0])
+            for sudoku, (solution, solved) in itertools.izip(self, results):
+                sudoku.read_str(solution)
+                if not solved:
+                    print "Warning: bogus puzzle."
+        else:
+            start, count = shard or (0, 1)
+            progress = None
+            if checkpoint:
+                from checkpoint import CheckpointedOutput
+                progress = CheckpointedOutput(outfile, checkpoint, shard)
+                # the index of the next puzzle of the shard
+                start = max(start, progress.checkpoint.position)
+                if v and progress.checkpoint.completed:
+                    print "Resuming after {!s} sudokus.".format(progress.checkpoint.completed)
+            pending, bogus = [], 0 # written at the next checkpoint
+            for i in xrange(start, total, count):
+                sudoku = self[i]
+                if v: print sudoku
+                puzzle_stats = SolveStats() if stats else None
+                deadline = None if timeout is None else time.time() + timeout
+                solved = sudoku.solve(engine, cache, puzzle_stats, deadline, max_nodes)
+                if solved is BUDGET_EXCEEDED and on_budget == "retry":
+                    deadline = None if timeout is None else time.time() + timeout
+                    solved = sudoku.solve(retry_engine, cache, puzzle_stats,
+                        deadline, max_nodes)
+                if solved is BUDGET_EXCEEDED:
+                    self.exceeded.append(i)
+                    if on_budget != "skip":
+                        print "Warning: puzzle {!s} is over budget.".format(i)
+                elif not solved:
+                    print "Warning: bogus puzzle."
+                    bogus += 1
+                if stats:
+                    self.stats.add(puzzle_stats)
+                    if statsfile:
+                        statsfile.write(puzzle_stats.to_json() + "\n")
+                if v: print sudoku
+                if v: print "{!s} out of {!s} sudokus solved.".format(i+1, total)
+                if progress:
+                    pending.append(sudoku.to_str())
+                    if len(pending) == checkpoint_every:
+                        progress.write(pending, i + count, bogus=bogus)
+                        pending, bogus = [], 0
+            if progress:
+                progress.write(pending, total, bogus=bogus)
+                progress.finish()
+                outfile = None # written already
+            elif shard and outfile:
+                outfile.writelines(self[i].to_str() + "\n"
+                    for i in xrange(shard[0], total, count))
+                outfile = None
         if outfile:
             if v: print "Writing output to file."
-            for sudoku in self: #TODO call repr or stg.
-                for col in xrange(9):
-                    for row in xrange(9):
-                        outfile.write(str(sudoku.table[(col,row)]))
-                outfile.write("\n")
+            outfile.writelines(sudoku.to_str() + "\n" for sudoku in self)
             if v: print "Done."
+        if stats and v: print self.stats.summary()
         return "Success"
 
+    def classify_all(self, outfile=None, verbose=True, engine="classic",
+            workers=1, chunksize=16):
+        """ Tags every puzzle of the collection as INVALID, UNIQUE or
+        MULTIPLE (see Sudoku.classify()) and returns the list of tags. The
+        puzzles themselves are left unsolved. With workers other than 1 the
+        puzzles are shared out to a process pool, see
+        parallel.classify_parallel(). If outfile is given, every puzzle is
+        written to it followed by its tag. """
+        if workers != 1:
+            from parallel import classify_parallel
+            tags = classify_parallel([sudoku.to_str() for sudoku in self],
+                engine, workers, chunksize)
+        else:
+            tags = [sudoku.classify(engine) for sudoku in self]
+        if verbose:
+            for tag in (UNIQUE, MULTIPLE, INVALID):
+                print "{!s}: {!s}".format(tag, tags.count(tag))
+        if outfile:
+            outfile.writelines("{!s} {!s}\n".format(sudoku.to_str(), tag)
+                for sudoku, tag in itertools.izip(self, tags))
+        return tags
+
     def __getitem__(self, no):
         return self.sudokus[no]
     
@@ -91,10 +250,24 @@ class Sudoku(object):
     This combines simple elimination techniques (see Sudoku.solve1, Sudoku.solve2 andSudoku.solve3)
     with backtracking (which is only used when simple methods fail)."""
 
-    def __init__(self, infile=None, instr=None, inlist=None, indict=None): 
+    # alternative board representations that solve() can delegate to, see
+    # Sudoku.solve_with(): a board class, or the (module, class name) to
+    # import it from on first use
+    engines = {"bitmask": ("bitboard", "BitBoard"), "dlx": ("dlx", "DancingLinks")}
+
+    stats = None # the stats.SolveStats being filled in, see solve()
+    budget = None # the budget.Budget of the search, see solve()
+    depth = 0 # level of backtracking, see bt()
+    heuristics = ("mrv", "set") # cell selector and value order, see branches()
+
+    # box size -> the tables of the board geometry, see geometry()
+    geometries = {}
+
+    def __init__(self, infile=None, instr=None, inlist=None, indict=None):
         """ Read in puzzle from a file, a string or a list parameter.
         You should define only one kind of input, otherwise the result
-        is undetermined
+        is undetermined. The size of the board (9x9, 16x16 or 25x25)
+        follows from the input, see read_str().
 
         >>> mysudoku = Sudoku(infile=myfile) # read data in from myfile
         >>> mysudoku = Sudoku(instr=("30000060000005018000060170000007")
@@ -116,70 +289,258 @@ class Sudoku(object):
                         ("to retrieve the puzzle"))
         except ValueError:
             raise SudokuInputError
-        self.initialize_regions()
-        self.initialize_peers()
-        self.initialize_get_containing_methods()
-        self._solve1_visited = []
+        self._solve1_visited = set()
 
 
     # high-level solving functions
 
-    def solve(self):
+    def solve(self, engine="classic", cache=None, stats=None, deadline=None,
+            max_nodes=None, **options):
         """ The main function of this class. Tries to solve the
         puzzle. It returns False if the puzzle is inconsistent
-        and True otherwise.""" 
-        # iterate solve1(), solve2() and solve3() until stuck.
-        # turns out that repeating solve1 3 times is the optimal
-        # thing to do.
-        solvers = [self.solve1]*3 + [self.solve2, self.solve3]
-        if self.repeat_until_stuck(solvers): 
+        and True otherwise. The default "classic" engine works on
+        self.table directly, any other engine is looked up in
+        Sudoku.engines (see Sudoku.solve_with()). If a
+        cache.SolutionCache is given, it is checked before solving
+        and updated after. Any other keyword option is passed on to
+        the solve() method of the engine, e.g. the techniques of the
+        bitmask engine. The classic engine takes workers and depth, see
+        Sudoku.bt(), and select and order, see Sudoku.branches(). If a stats.SolveStats object is given, it is
+        filled in with what the solve did; without one no statistics
+        are kept at all. A deadline (a time.time() value) and/or a
+        maximum number of search nodes put the search on a budget: if
+        it runs out, BUDGET_EXCEEDED is returned, self.table is left
+        as it was before the search and the stats are kept. (The
+        branches given to workers don't share the budget.)""" 
+        if deadline is not None or max_nodes is not None:
+            return self.solve_budgeted(Budget(deadline, max_nodes), engine,
+                cache, stats, **options)
+        if stats is not None:
+            return self.solve_instrumented(stats, engine, cache, **options)
+        if cache is not None:
+            return self.solve_cached(engine, cache, **options)
+        if engine != "classic":
+            return self.solve_with(engine, **options)
+        workers, depth = self.classic_options(options)
+        if self.propagate():
             return True
         else:
             # if the solvers don't solve the puzzle
             if self.is_consistent(): # and seems consistent
-                return self.bt() # do some backtracking
+                if self.stats is not None and not self.depth:
+                    start = time.time()
+                    solved = self.bt(workers, depth)
+                    self.stats.times["search"] += time.time() - start
+                    return solved
+                return self.bt(workers, depth) # do some backtracking
             else:
                 return False
 
-    def bt(self):
+    def classic_options(self, options):
+        """ returns the workers and depth options of the classic engine and
+        sets self.heuristics from the select and order options (they stay
+        for later solves), complains about any other """
+        workers = options.pop("workers", 1)
+        depth = options.pop("depth", 1)
+        select = options.pop("select", self.heuristics[0])
+        order = options.pop("order", self.heuristics[1])
+        if select not in CELL_SELECTORS:
+            raise SudokuError("Unknown cell selector: {!s}".format(select))
+        if order not in VALUE_ORDERS:
+            raise SudokuError("Unknown value order: {!s}".format(order))
+        self.heuristics = (select, order)
+        if options:
+            raise SudokuError("Unknown options for the classic engine: {!s}".format(
+                ", ".join(sorted(options))))
+        return workers, depth
+
+    def count_solutions(self, limit=2, engine="classic", **options):
+        """ Returns the number of solutions of the puzzle, but stops
+        counting at limit (limit=None counts every solution). self.table is
+        left as it is. engine and options work as in solve(), except that
+        the engines have to know how to count(). """
+        if engine != "classic":
+            board = self.board(engine)
+            count = board.count(limit, **options)
+            self.nodes = board.nodes
+            return count
+        workers, depth = self.classic_options(options)
+        child = SudokuChild(self.table, self._solve1_visited,
+            heuristics=self.heuristics)
+        if child.propagate():
+            return 1
+        if not child.is_consistent():
+            return 0
+        return child.bt_count(limit, workers, depth)
+
+    def has_unique_solution(self, engine="classic", **options):
+        return self.count_solutions(2, engine, **options) == 1
+
+    def classify(self, engine="classic", **options):
+        """ INVALID, UNIQUE or MULTIPLE, depending on the number of
+        solutions """
+        return (INVALID, UNIQUE, MULTIPLE)[self.count_solutions(2, engine, **options)]
+
+    def propagate(self):
+        """ Iterates solve1(), solve2() and solve3() until stuck. Returns
+        True if that solved the puzzle. """
+        # turns out that repeating solve1 3 times is the optimal
+        # thing to do.
+        solvers = [self.solve1]*3 + [self.solve2, self.solve3]
+        return self.repeat_until_stuck(solvers)
+
+    def solve_budgeted(self, budget, engine, cache, stats, **options):
+        """ solve() on a budget.Budget """
+        self.budget = budget
+        try:
+            return self.solve(engine, cache, stats, **options)
+        except BudgetExceeded:
+            if stats is not None:
+                stats.solved = False
+                stats.budget_exceeded += 1
+            return BUDGET_EXCEEDED
+        finally:
+            del self.budget
+
+    def solve_instrumented(self, stats, engine, cache, **options):
+        """ solve() filling in stats """
+        if stats.puzzle is None:
+            stats.puzzle = self.to_str()
+        self.stats = stats
+        start = time.time()
+        try:
+            stats.solved = self.solve(engine, cache, **options)
+        finally:
+            stats.times["total"] += time.time() - start
+            del self.stats
+        return stats.solved
+
+    def solve_cached(self, engine, cache, **options):
+        """ solve() with a look into cache first """
+        if self.size != 3:
+            raise SudokuError("The solution cache only takes 9x9 puzzles.")
+        puzzle = self.to_str()
+        solution = cache.get(puzzle)
+        # the table may hold fewer candidates than the puzzle string tells
+        if solution is not None and all(int(digit) in self.table[divmod(i, 9)]
+                for i, digit in enumerate(solution)):
+            self.read_str(solution)
+            return True
+        solved = self.solve(engine, **options)
+        if solved:
+            cache.put(puzzle, self.to_str())
+        return solved
+
+    def solve_with(self, engine, **options):
+        """ Solve the puzzle on an alternative board representation and copy
+        the result back to self.table. The number of branches tried is
+        stored in self.nodes. """
+        board = self.board(engine)
+        board.budget = self.budget
+        try:
+            solved = board.solve(**options)
+        finally:
+            self.nodes = board.nodes
+            if self.stats is not None:
+                self.stats.nodes += board.nodes
+                for name, eliminations in getattr(board, "eliminations", {}).iteritems():
+                    self.stats.eliminations[name] += eliminations
+        self.table = board.to_table()
+        self.count_cells()
+        return solved
+
+    def board(self, engine):
+        """ self.table converted to the board of an alternative engine """
+        try:
+            board_class = self.engines[engine]
+        except KeyError:
+            raise SudokuError("Unknown engine: {!s}".format(engine))
+        if isinstance(board_class, tuple):
+            module, name = board_class
+            board_class = getattr(__import__(module), name)
+        try:
+            return board_class.from_table(self.table)
+        except ValueError as e: # a board size the engine doesn't take
+            raise SudokuError(str(e))
+
+    def bt(self, workers=1, depth=1):
         """ backtracking function if other techniques
-        fail """
-        table_copy = self.table.copy()
-        mincell = min([ (len(cell), cell) 
-            for cell in table_copy.itervalues() if len(cell)>1], key=lambda x: x[0])[1]
-        mincell_copy = mincell.copy()
-        mincell.clear()
-        for cand in mincell_copy:
-            mincell.add(cand)
-            #print mincell_copy, cand
-            #print table_copy
-            child = SudokuChild(table_copy, self._solve1_visited)
+        fail. With workers other than 1 the branches of the first depth
+        levels are explored speculatively in a process pool and the first
+        solution found wins, see parallel.solve_branches(). """
+        if workers != 1:
+            from parallel import solve_branches
+            return solve_branches(self, workers, depth)
+        stats = self.stats
+        if stats is not None:
+            stats.max_depth = max(stats.max_depth, self.depth + 1)
+        for child in self.branches():
+            if stats is not None:
+                stats.nodes += 1
+            if self.budget is not None:
+                self.budget.charge()
             if child.solve():
                 self.table = child.table
+                self.count_cells()
                 return True
-            mincell.clear()
-        else:
-            return False
+            if stats is not None:
+                stats.dead_ends += 1
+        return False
+
+    def bt_count(self, limit=None, workers=1, depth=1):
+        """ The counting counterpart of bt(): returns the number of
+        solutions of a puzzle that propagate() got stuck on, stopping at
+        limit (if given). self.table is left as it is. workers and depth
+        work as in bt(), the counts of the branches are summed up. """
+        if workers != 1:
+            from parallel import count_branches
+            return count_branches(self, limit, workers, depth)
+        count = 0
+        for child in self.branches():
+            if self.budget is not None:
+                self.budget.charge()
+            if child.propagate():
+                count += 1
+            elif child.is_consistent():
+                count += child.bt_count(None if limit is None else limit - count)
+            if limit is not None and count >= limit:
+                break
+        return count
+
+    def branches(self):
+        """ Yields a SudokuChild for every candidate of an open cell, that
+        candidate filled in. The cell and the order of the candidates are
+        up to the heuristics named by self.heuristics (see heuristics.py),
+        by default the first cell with the fewest candidates and the order
+        of its set. The children are not solved yet. """
+        select, order = self.heuristics
+        coord = CELL_SELECTORS[select](self)
+        if coord is None: # filled in, but not solved
+            return
+        for cand in VALUE_ORDERS[order](self, coord):
+            child = SudokuChild(self.table, self._solve1_visited, self.stats,
+                self.depth + 1, self.heuristics)
+            child.budget = self.budget
+            child.fill_in(coord, cand)
+            yield child
 
     def solve1(self): 
         """ For all regions check if there is only one cell left in
         it. If so, fill in the last cell accordingly. Do this until
         stuck. """
-        for col in xrange(9):
-            for row in xrange(9):
-                cell = self.table[(col,row)] 
-                if len(cell)==1 and (col,row) not in self._solve1_visited:
-                    self._solve1_visited.append((col,row))
-                    (value,) = cell # unpack the element from this singleton set
-                    # loop through all the cells where the same 
-                    # value would result in a collision and try
-                    # to delete value from the list of possible
-                    # candidates:
-                    for (col2, row2) in self.peers(col,row):
-                            try:
-                                self.table[(col2,row2)].remove(value)
-                            except KeyError:
-                                pass
+        table = self.table
+        for coord in self.coords:
+            cell = table[coord]
+            if len(cell)==1 and coord not in self._solve1_visited:
+                self._solve1_visited.add(coord)
+                (value,) = cell # unpack the element from this singleton set
+                # loop through all the cells where the same
+                # value would result in a collision and try
+                # to delete value from the list of possible
+                # candidates:
+                for peercoord in self.peersdict[coord]:
+                    if value in table[peercoord]:
+                        self.remove_candidate(peercoord, value)
 
     def solve2(self):
         """For all regions and numbers not yet filled in, check if
@@ -187,20 +548,19 @@ class Sudoku(object):
         If so, insert it. This only makes sense in conjunction with
         solve 1"""
         for region in self.regions:
-            for no in xrange(1,10):
+            for no in self.numbers:
                 possible = []
                 for coord in region:
                     if no in self.table[coord]:
                         if len(possible)==1:
                             break
                         else:
-                            possible.append(self.table[coord])
+                            possible.append(coord)
                 else:
                     if len(possible)!=1: continue
-                    cell = possible[0]
-                    if cell: #we don't want to "repair" inconsistent puzzles #TODO is this enough?
-                        cell.clear()
-                        cell.add(no)
+                    coord = possible[0]
+                    if self.table[coord]: #we don't want to "repair" inconsistent puzzles #TODO is this enough?
+                        self.fill_in(coord, no)
 
     def solve3(self): 
         """ For all regions and numbers check the subregion (subr_1) where this
@@ -211,7 +571,7 @@ class Sudoku(object):
 
         https://www.sudokuoftheday.com/techniques/candidate-lines/ 
         """
-        numbers = range(1,10)
+        numbers = self.numbers
         for region in self.lines: #scan for lines that intersect boxes
         #loop through the subregions defined by the candidate numbers:
             for n in numbers:
@@ -220,10 +580,8 @@ class Sudoku(object):
                 if superbox:
                     target = superbox - subregion
                     for coord in target:
-                        try:
-                            self.table[coord].remove(n)
-                        except KeyError: 
-                            pass
+                        if n in self.table[coord]:
+                            self.remove_candidate(coord, n)
 
         for region in self.boxes: #scan for boxes that intersect lines
         #loop through the subregions defined by the candidate numbers:
@@ -233,67 +591,110 @@ class Sudoku(object):
                 if superline:
                     target = superline - subregion
                     for coord in target:
-                        try:
-                            self.table[coord].remove(n)
-                        except KeyError: 
-                            pass
+                        if n in self.table[coord]:
+                            self.remove_candidate(coord, n)
 
     #middle level helper methods
 
     @classmethod
-    def initialize_get_containing_methods(cls): #TODO document, find a better name
-        if hasattr(cls, "superboxes"):
-            return
-        cls.superboxes=defaultdict(set)
-        cls.superlines=defaultdict(set)
-        for box in cls.boxes:
-            pairs = itertools.permutations(box,2)
-            triplets = itertools.permutations(box,3)
-            subregions = itertools.chain(pairs,triplets)
-            for subregion in subregions:
-                cls.superboxes[frozenset(subregion)]=box
-        for line in cls.lines:
-            pairs = itertools.permutations(line,2)
-            triplets = itertools.permutations(line,3)
-            subregions = itertools.chain(pairs,triplets)
-            for subregion in subregions:
-                cls.superlines[frozenset(subregion)]=line
-
-    def get_containing_line(self, region): return self.superlines[region]
-    def get_containing_box(self, region): return self.superboxes[region]
+    def geometry(cls, size=3):
+        """ The tables of the board with size x size boxes (size 3 is the
+        9x9 board), built on first use: width, coords, numbers, regions,
+        boxes, lines, cell_regions, peersdict, superboxes, superlines and
+        char_candidates. """
+        try:
+            return cls.geometries[size]
+        except KeyError:
+            pass
+        if size not in BOX_SIZES:
+            raise SudokuInputError("Unsupported box size: {!r}".format(size))
+        width = size*size
+        tables = {"size": size, "width": width,
+            "coords": [(x, y) for x in xrange(width) for y in xrange(width)],
+            "numbers": range(1, width+1)}
+        cls.initialize_regions(tables)
+        cls.initialize_peers(tables)
+        cls.initialize_get_containing_methods(tables)
+        cls.initialize_symbols(tables)
+        cls.geometries[size] = tables
+        return tables
 
-    @classmethod
-    def initialize_peers(cls): 
-        """ Initialize a list of peers for each cell in self.peers, so that we
-        don't have to generate this list every time. """
-        if hasattr(cls, "peersdict"):
-            return
-        cls.peersdict={}
-        for col in xrange(9):
-            for row in xrange(9):
-                cls.peersdict[(col,row)] = [(col_peer, row_peer)
-                for region in cls.regions 
-                if (col,row) in region
-                for (col_peer, row_peer) in region
-                if (col_peer, row_peer) != (col, row)]
+    def set_geometry(self, size):
+        """ makes the tables of geometry(size) attributes of self """
+        self.__dict__.update(self.geometry(size))
+
+    @staticmethod
+    def initialize_get_containing_methods(tables): #TODO find a better name
+        """ Maps every set of 2 or more cells that a box and a line have in
+        common to that box in tables["superboxes"] and to that line in
+        tables["superlines"]. solve3() only looks up the cells of a line
+        (box) that can still hold a number, so sets of cells that are not
+        in one line and one box would never be found anyway; for 25x25
+        boards that keeps the maps at thousands of entries instead of
+        millions. Sets are unordered, so combinations are enough. """
+        combinations = itertools.combinations
+        superboxes, superlines = {}, {}
+        for box in tables["boxes"]:
+            for line in tables["lines"]:
+                segment = box & line
+                for length in xrange(2, len(segment)+1):
+                    for subregion in combinations(segment, length):
+                        subregion = frozenset(subregion)
+                        superboxes[subregion] = box
+                        superlines[subregion] = line
+        tables["superboxes"], tables["superlines"] = superboxes, superlines
+
+    # the line (box) containing a set of cells, None if there is none
+    def get_containing_line(self, region): return self.superlines.get(region)
+    def get_containing_box(self, region): return self.superboxes.get(region)
+
+    @staticmethod
+    def initialize_peers(tables):
+        """ Initialize a list of peers for each cell in tables["peersdict"],
+        so that we don't have to generate this list every time. """
+        containing = dict((coord, []) for coord in tables["coords"])
+        for region in tables["regions"]:
+            for coord in region:
+                containing[coord].append(region)
+        peersdict = tables["peersdict"] = {}
+        for coord, regions in containing.iteritems():
+            # the cells of the box, the row and the column, each of them once
+            peersdict[coord] = list(frozenset().union(*regions) - frozenset([coord]))
 
     def peers(self, coll, row):
         return self.peersdict[(coll, row)]
 
-    @classmethod
-    def initialize_regions(cls): 
-        """ Initializes regions. """
-        if hasattr(cls,"regions"): 
-            return
+    @staticmethod
+    def initialize_regions(tables):
+        """ Initializes regions: the boxes first, then the rows, then the
+        columns. """
+        size, width = tables["size"], tables["width"]
         prod = itertools.product
-        projections = [range(3), range(3, 6), range(6,9)]
+        projections = [range(k*size, (k+1)*size) for k in xrange(size)]
         subsquares = [frozenset((row, col) for row, col in prod(x,y))
             for x, y in prod(projections, projections)]
-        rows  = [frozenset((x,y) for y in range(9)) for x in range(9)]
-        cols  = [frozenset((x,y) for x in range(9)) for y in range(9)]
-        cls.regions = subsquares + rows + cols
-        cls.boxes = subsquares
-        cls.lines = rows + cols
+        rows  = [frozenset((x,y) for y in range(width)) for x in range(width)]
+        cols  = [frozenset((x,y) for x in range(width)) for y in range(width)]
+        tables["regions"] = subsquares + rows + cols
+        tables["boxes"] = subsquares
+        tables["lines"] = rows + cols
+        # the indices of the regions containing every cell
+        cell_regions = tables["cell_regions"] = dict(
+            (coord, []) for coord in tables["coords"])
+        for index, region in enumerate(tables["regions"]):
+            for coord in region:
+                cell_regions[coord].append(index)
+
+    @staticmethod
+    def initialize_symbols(tables):
+        """ The candidates of every character of the string format in
+        tables["char_candidates"], see SYMBOLS """
+        width = tables["width"]
+        every = tuple(range(1, width+1))
+        candidates = {"0": every, ".": every}
+        for digit, symbol in enumerate(SYMBOLS[:width], 1):
+            candidates[symbol] = candidates[symbol.lower()] = (digit,)
+        tables["char_candidates"] = candidates
 
     def repeat_until_stuck(self, function): 
         """ Iterates a solving function until it gets stuck (i. e. self.table
@@ -303,51 +704,150 @@ class Sudoku(object):
             tasks = [function]
         else:
             tasks = function
-        table_old_hash=None
-        table_actual_hash = self.get_table_hash()
-        while table_old_hash != table_actual_hash: 
-            # Hashing might lead to some false positives, still
-            # I think this is a good performance tradeoff
-            # when compared to copying.
-            table_old_hash = self.get_table_hash()
+        while True:
+            # every candidate removal bumps self.changes, so we are stuck
+            # exactly when a whole round leaves it as it was
+            changes = self.changes
+            if self.stats is not None:
+                self.stats.iterations += 1
             for func in tasks:
-                func()
+                if self.stats is None:
+                    func()
+                else:
+                    self.call_counted(func)
                 if self.is_solved():
                     return True
                 if not self.is_consistent(): #TODO only do this with solve1
                     return False
-            table_actual_hash = self.get_table_hash()
-        return False
+            if self.changes == changes:
+                return False
+
+    def call_counted(self, func):
+        """ calls a solver, adding its running time and the number of
+        candidates it eliminated to self.stats """
+        name = func.__name__
+        before = self.changes
+        start = time.time()
+        func()
+        self.stats.times[name] += time.time() - start
+        self.stats.calls[name] += 1
+        self.stats.eliminations[name] += self.changes - before
 
     def is_solved(self):
         """ return True if the puzzle is solved,
         False otherwise """
-        return all(len(cand_lst)==1 for cand_lst in self.table.itervalues())
+        if self.solved_cells != len(self.table):
+            return False
+        # solve2 can fill in the last cells of an inconsistent branch
+        # without noticing a collision, so check the regions as well
+        width = self.width
+        return all(len(set(next(iter(self.table[coord])) for coord in region))==width
+            for region in self.regions)
                                     
     def is_consistent(self):
         """ Detects collisions. Technically this function just returns False
         if there is a cell in self.table which is empty (no 
         candidates left) """
-        return all(cand_lst for cand_lst in self.table.itervalues())
+        return not self.empty_cells
 
     # low-level internal processing methods
 
-    def get_table_hash(self):
-        table_tuple = frozenset([(key, tuple(value)) for key, value in self.table.items()])
-        return hash(table_tuple)
+    # The solvers change self.table only through remove_candidate() and
+    # fill_in(), which keep these counters, self.buckets, self.open_counts
+    # and self.placed up to date.
+    # Whenever self.table is replaced, count_cells() has to be called.
+    changes = 0 # number of candidates removed so far
+    solved_cells = 0 # cells with a single candidate
+    empty_cells = 0 # cells without candidates
+
+    def count_cells(self):
+        """ recounts the solved and the empty cells of self.table and
+        rebuilds self.buckets: buckets[k] is the set of the coordinates of
+        the cells with k candidates, for k >= 2 (the first two are empty),
+        self.open_counts: the number of cells with 2 or more candidates of
+        every region, and self.placed: placed[d] is the number of cells
+        with the single candidate d """
+        buckets = [set() for _ in xrange(self.width + 1)]
+        open_counts = [0]*len(self.regions)
+        placed = [0]*(self.width + 1)
+        cell_regions = self.cell_regions
+        solved = empty = 0
+        for coord, cell in self.table.iteritems():
+            left = len(cell)
+            if left > 1:
+                buckets[left].add(coord)
+                for index in cell_regions[coord]:
+                    open_counts[index] += 1
+            elif left:
+                solved += 1
+                for value in cell:
+                    placed[value] += 1
+            else:
+                empty += 1
+        self.buckets = buckets
+        self.open_counts = open_counts
+        self.placed = placed
+        self.solved_cells = solved
+        self.empty_cells = empty
+
+    def remove_candidate(self, coord, value):
+        """ removes value from the candidates of the cell at coord (it has to
+        be one of them) """
+        cell = self.table[coord]
+        cell.remove(value)
+        self.changes += 1
+        left = len(cell)
+        if left > 1:
+            buckets = self.buckets
+            buckets[left+1].remove(coord)
+            buckets[left].add(coord)
+        elif left:
+            self.buckets[2].remove(coord)
+            self.solved_cells += 1
+            self.close_cell(coord, cell)
+        else:
+            self.solved_cells -= 1
+            self.empty_cells += 1
+            self.placed[value] -= 1
 
-    def char_to_cand_list(self, char):
-        """ convert a character to a list of candidates according
-        to the following pattern:
-        0 -> [1, 2, 3, 4, 5, 6, 7, 8, 9]
-        1 -> [1], 2 -> [2], ...
+    def fill_in(self, coord, value):
+        """ removes every candidate but value (which has to be one of them)
+        from the cell at coord """
+        cell = self.table[coord]
+        left = len(cell)
+        if left > 1:
+            cell.clear()
+            cell.add(value)
+            self.changes += left - 1
+            self.solved_cells += 1
+            self.buckets[left].remove(coord)
+            self.close_cell(coord, cell)
+
+    def close_cell(self, coord, cell):
+        """ counts the cell at coord, which is down to a single candidate,
+        as placed instead of open """
+        open_counts = self.open_counts
+        for index in self.cell_regions[coord]:
+            open_counts[index] -= 1
+        for value in cell:
+            self.placed[value] += 1
+
+    @classmethod
+    def char_to_cand_list(cls, char, size=3):
+        """ convert a character to a tuple of candidates according
+        to the following pattern (for a 9x9 board, see SYMBOLS):
+        0 -> (1, 2, 3, 4, 5, 6, 7, 8, 9)
+        1 -> (1,), 2 -> (2,), ...
+        The result is shared between calls, so it is immutable.
         """
-        every = range(1, 9+1)
-        if char == "0": return every
-        else: return [int(char)]
-    
+        try:
+            return cls.geometry(size)["char_candidates"][char]
+        except KeyError:
+            raise ValueError("Not a sudoku character: {!r}".format(char))
+
     def read_dict(self, indict):
         """ reads a dictionary and copies it to self.table """
+        self.set_geometry(BOARD_SIZES.get(len(indict), 3))
         self.table = self.copy_table(indict)
         self.check_table() # TODO move this to __init__
 
@@ -358,83 +858,177 @@ class Sudoku(object):
 
 
     def read_file(self, infile): 
-        """ reads in input file to self.table"""
-        puzzle_str = infile.read(81)
+        """ reads in input file to self.table, whitespace (like line breaks
+        between the rows) is skipped """
+        puzzle_str = "".join(infile.read().split())
         self.read_str(puzzle_str)
 
     def read_list(self, inlist): 
         """ reads in input list to self.table """
+        from copy import deepcopy
+        self.set_geometry(BOARD_SIZES.get(len(inlist)**2, 3))
         self.table = dict()
-        listcopy = copy.deepcopy(inlist)
+        listcopy = deepcopy(inlist)
         for i1, col in enumerate(listcopy):
             for i2, cell in enumerate(col):
                 self.table[(i1,i2)]=cell
         self.check_table()
 
     def read_str(self, instr):
-        """ reads in a string representation of a sudoku puzzle to self.table """
+        """ reads in a string representation of a sudoku puzzle to self.table.
+        The length tells the size of the board: 256 characters are a 16x16
+        board and 625 a 25x25 one, anything else is read as a 9x9 board from
+        its first 81 characters. """
         if len(instr) < 81:
             raise SudokuInputError("Invalid input. Grid geometry corrupt. ")
+        self.set_geometry(BOARD_SIZES.get(len(instr), 3))
+        candidates = self.char_candidates
         self.table = dict()
-        for row in xrange(9):
-            for col in xrange(9):
-                self.table[(row,col)]=set(self.char_to_cand_list(instr[row*9+col]))
+        for i, coord in enumerate(self.coords):
+            try:
+                self.table[coord] = set(candidates[instr[i]])
+            except KeyError:
+                raise ValueError("Not a sudoku character: {!r}".format(instr[i]))
         self.check_table()
 
     def check_table(self):
         """ Check self.table for possible corruptions. This is just a
         low-level internal check to filter out corrupt input. It doesn't
         detect inconsistencies (i. e. collisions within regions). """
-        numbers = range(1, 10)
-        # there should be 9 columns:
-        if len(set([a for (a,b) in self.table.keys()])) != 9: 
+        width = self.width
+        numbers = self.numbers
+        # there should be 9 (width) columns:
+        if len(set([a for (a,b) in self.table.keys()])) != width:
             raise SudokuInputError("Invalid input. Grid geometry corrupt. ")
         #and 9 cells in every columns:
         #TODO de-obfuscate this?
-        for col in xrange(9):
+        for col in xrange(width):
             rows = set(row for (x,row) in self.table.keys() if x == col)
-            if not len(rows) == 9:
+            if not len(rows) == width:
                 raise SudokuInputError("Invalid input. Grid geometry corrupt.")
         #if not all(len(set([y for (x,y) in self.table.keys() if x == col])) == 9 for col in xrange(9)):
         #    raise SudokuInputError("Invalid input. Grid geometry corrupt.")
 
-        #and no numbers besides 1,2,...,9:
-        candidates = set(no for col in xrange(9) for row in xrange(9) for no in self.table[col,row])
+        #and no numbers besides 1,2,...,9 (width):
+        candidates = set(no for coord in self.coords for no in self.table[coord])
         if not candidates.issubset(numbers):
             p(candidates)
             raise SudokuInputError("Invalid input. Grid geometry corrupt.") #TODO more informative message here
+        self.count_cells()
 
     def __str__(self):
         """ Pretty printer. This loses information, so that it can be easily 
         readable by humans: it only prints out unambiguous cells. """
         out = ""
-        for col in range(9):
-            for row in range(9):
+        for col in range(self.width):
+            for row in range(self.width):
                 cell = self.table[(col,row)]
                 if len(cell)==1:
-                    out=out+str(next(iter(cell))).center(3)
+                    out=out+SYMBOLS[next(iter(cell))-1].center(3)
                 else:
                     out=out+"_".center(3)
             out = out+"\n"
         return out
         
+    def to_str(self):
+        """ The 81 (256, 625) character format that read_str() reads in.
+        Cells that are not filled in are written as "0". """
+        out = []
+        for coord in self.coords:
+            cell = self.table[coord]
+            if len(cell)==1:
+                out.append(SYMBOLS[next(iter(cell))-1])
+            else:
+                out.append("0")
+        return "".join(out)
+
     def __repr__(self): #TODO atm we can't read this in!
         """ The output of this function is the format that the class
         can read in as well (serialization) - a list of possibilities
-        for all cells of the 9*9 grid. This doesn't lose any 
+        for all cells of the grid. This doesn't lose any 
         information. """
         return repr(self.table)
 
 class SudokuChild(Sudoku):
-    def __init__(self, table, solve1_visited):
+    def __init__(self, table, solve1_visited, stats=None, depth=0,
+            heuristics=None):
         self.table=self.copy_table(table) #TODO should I use super()?
-        self._solve1_visited = solve1_visited[:]
+        self.set_geometry(BOARD_SIZES[len(table)])
+        self._solve1_visited = set(solve1_visited)
+        self.count_cells()
+        self.stats = stats
+        self.depth = depth
+        if heuristics is not None:
+            self.heuristics = heuristics
 
 if __name__ == "__main__":
-    with open(sys.argv[1]) as infile:
+    import argparse
+    parser = argparse.ArgumentParser(description="A sudoku solver")
+    parser.add_argument("puzzle", help="file with a single puzzle, or with "
+        "--batch a file with one puzzle per line (- reads stdin, .gz files "
+        "are decompressed)")
+    parser.add_argument("--batch", metavar="OUTFILE", help="solve every "
+        "puzzle of the file and write the solutions to OUTFILE (- is stdout)")
+    parser.add_argument("--engine", default="classic",
+        choices=["classic"] + sorted(Sudoku.engines))
+    parser.add_argument("--workers", type=int, default=1,
+        help="size of the process pool, 0 uses every core. With --batch the "
+        "puzzles are shared out, otherwise the branches of the backtracking")
+    parser.add_argument("--depth", type=int, default=1, help="levels of "
+        "backtracking explored in parallel on a single puzzle")
+    parser.add_argument("--timeout", type=float,
+        help="give up on a single puzzle after this many seconds")
+    parser.add_argument("--max-nodes", type=int,
+        help="give up on a single puzzle after this many search nodes")
+    parser.add_argument("--verbose", action="store_true", help="print search "
+        "statistics, with --batch one line of JSON per puzzle and a summary "
+        "to stderr")
+    parser.add_argument("--checkpoint", metavar="PATH", help="with --batch, "
+        "save the progress to PATH after every batch, and resume from it if "
+        "it is there")
+    parser.add_argument("--shard", metavar="N/COUNT", help="with --batch, "
+        "only solve the N-th (0 based) of every COUNT puzzles, see checkpoint.py")
+    args = parser.parse_args()
+    if args.batch:
+        from checkpoint import parse_shard
+        from stream import open_puzzles, solve_stream
+        shard = parse_shard(args.shard) if args.shard else None
+        infile = open_puzzles(args.puzzle)
+        if args.checkpoint and any(path == "-" or path.endswith(".gz")
+                for path in (args.puzzle, args.batch)):
+            raise SudokuError("Checkpoints need plain, seekable input and "
+                "output files, not - or .gz.")
+        # a checkpointed output is truncated to the size of the checkpoint
+        outfile = open_puzzles(args.batch, "a" if args.checkpoint else "w")
+        stats = SolveStats(count=0) if args.verbose else None
+        try:
+            total, bogus = solve_stream(infile, outfile, args.engine,
+                workers=args.workers, stats=stats, statsfile=sys.stderr,
+                checkpoint=args.checkpoint, shard=shard)
+        finally:
+            for f in (infile, outfile):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
+        if bogus:
+            sys.stderr.write("Warning: {!s} bogus puzzles out of {!s}.\n".format(bogus, total))
+        if stats:
+            sys.stderr.write(stats.summary())
+        sys.exit()
+    with open(args.puzzle) as infile:
         sudoku = Sudoku(infile=infile)
     print sudoku
-    if sudoku.solve():
+    stats = SolveStats() if args.verbose else None
+    options = {}
+    if args.engine == "classic":
+        options = {"workers": args.workers, "depth": args.depth}
+    deadline = None if args.timeout is None else time.time() + args.timeout
+    solved = sudoku.solve(args.engine, stats=stats, deadline=deadline,
+        max_nodes=args.max_nodes, **options)
+    if solved:
         print sudoku
+    elif solved is BUDGET_EXCEEDED:
+        print "Gave up: the search ran out of its budget."
     else:
         print "This puzzle is invalid."
+    if stats:
+        print stats.summary()
@@ -1,7 +1,13 @@
 #! /usr/bin/python
 
 from sudoku import Sudoku, SudokuCollection, SudokuError, SudokuInputError
-import time
+from bitboard import BitBoard
+from stream import open_puzzles, solve_stream
+from benchmark import compare, format_result, run_benchmarks
+from StringIO import StringIO
+import gzip
+import json
+import tempfile
 
 def test_sudoku_class(): #rebuild this function
     """ performs tests on the Sudoku class """
@@ -142,6 +148,8 @@ def test_sudoku_class(): #rebuild this function
         sudoku = Sudoku(instr=incons)
         sudoku.solve()
         assert not sudoku.is_consistent()
+        assert not Sudoku(instr=incons).solve("bitmask")
+        assert not Sudoku(instr=incons).solve("dlx")
 
     sudoku = Sudoku(instr=validpuzzle) # OK, let's see a valid puzzle
     print sudoku
@@ -152,31 +160,712 @@ def test_sudoku_class(): #rebuild this function
     print "repr: \n {!r}".format(sudoku)
     print "sudoku.regions: \n{}".format(sudoku.regions)
 
+    bitsudoku = Sudoku(instr=validpuzzle) # the bitmask engine should agree
+    assert bitsudoku.solve("bitmask")
+    assert bitsudoku.is_solved()
+    assert bitsudoku.table == sudoku.table
+    dlxsudoku = Sudoku(instr=validpuzzle) # and so should exact cover
+    assert dlxsudoku.solve("dlx")
+    assert dlxsudoku.table == sudoku.table
+
     print "OK. Let's see how fast we can solve some puzzle collections."
 
-    # 50 easy, 95 hard
-    benchmarklist = [ ("50 puzzles from Project Euler", "puzzles/euler_puzzles_50.txt", "puzzles/euler_solutions_50.txt"),
-            ("95 hard puzzles", "puzzles/hard_puzzles_95.txt", "puzzles/hard_solutions_95.txt") ]
-
-    #5 hard
-    #benchmarklist = [("5 hard puzzles", "puzzles/hard_puzzles_5.txt", "puzzles/hard_solutions_5.txt") ] # for quick profiling
-
-    #50 easy
-    #benchmarklist = [ ("50 puzzles from Project Euler", "puzzles/euler_puzzles_50.txt", "puzzles/euler_solutions_50.txt")]
-
-    for collection_name, path_puzzle, path_solution in benchmarklist:
-        print collection_name
-        with open(path_puzzle) as puzzles, open(path_solution,"w") as solutions:
-            before = time.clock()
-            collection = SudokuCollection(puzzles)
-            collection.solve_all(solutions, verbose=True) #TODO make verbosity a command line parameter
-            puzzleno = len(collection.sudokus) #number of sudokus, TODO: implement API
-            after = time.clock()
-            elapsed = after-before
-            average = elapsed/puzzleno
-            print "Solving {!s} puzzles took {!s} secs, avg: {!s} sec".format(puzzleno, elapsed, average) #TODO check results
+    # one timed pass over every bundled set with every engine, see
+    # benchmark.py for repeated runs, JSON reports and baselines
+    report = run_benchmarks(repeat=1, warmup=0)
+    for result in report["results"]:
+        assert not result["mismatches"], format_result(result)
+    # the startup time is wall clock time of a subprocess, on a loaded host
+    # it can be over the budget; ./benchmark.py --compare checks the real one
+    report["startup"] = 0.0
+    assert compare(report, report) == []
+    slower = json.loads(json.dumps(report))
+    slower["results"][0]["p50"] *= 2
+    assert len(compare(report, slower, threshold=0.25)) == 0
+    assert len(compare(slower, report, threshold=0.25)) == 1
+    slower["results"][0]["p50"] = report["results"][0]["p50"]
+    slower["startup"] = 1.0 # import to first solve takes a second
+    assert len(compare(slower, report)) == 1
     print "Tests succesful!"
     return True
 
+def test_bitboard():
+    """ the in-place (trail) search and the copying search should take the
+    same branches and find the same solutions """
+    with open("puzzles/hard_puzzles_5.txt") as puzzles:
+        for line in puzzles:
+            inplace = BitBoard.from_str(line.strip())
+            copying = BitBoard.from_str(line.strip())
+            assert inplace.solve() and copying.solve(inplace=False)
+            assert inplace.cells == copying.cells
+            assert inplace.nodes == copying.nodes
+    return True
+
+def test_parallel():
+    """ a process pool should give the same solutions in the same order as
+    solving the collection in this process """
+    with open("puzzles/euler_puzzles_50.txt") as puzzles:
+        sequential = SudokuCollection(puzzles)
+    with open("puzzles/euler_puzzles_50.txt") as puzzles:
+        pooled = SudokuCollection(puzzles)
+    sequential.solve_all(verbose=False, engine="bitmask")
+    pooled.solve_all(verbose=False, engine="bitmask", workers=2, chunksize=4)
+    assert [s.to_str() for s in sequential] == [s.to_str() for s in pooled]
+    assert pooled.report.total == len(pooled)
+    print pooled.report
+    from multiprocessing import cpu_count
+    every = SudokuCollection(sudoku.to_str() for sudoku in sequential)
+    every.solve_all(verbose=False, engine="bitmask", workers=0) # every core
+    assert every.report.workers == cpu_count()
+    return True
+
+def test_parallel_branches():
+    """ speculative backtracking should solve and count like bt() """
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        line = [line.strip() for line in puzzles][6] # needs a lot of backtracking
+    for depth in (1, 2):
+        sudoku = Sudoku(instr=line)
+        assert sudoku.solve(workers=2, depth=depth)
+        assert sudoku.is_solved()
+    ambiguous = Sudoku(instr=line[:40] + "0"*41)
+    ambiguous.propagate()
+    assert ambiguous.bt_count(limit=20) == 20
+    assert ambiguous.bt_count(limit=20, workers=2, depth=2) == 20
+    unique = Sudoku(instr=line)
+    unique.propagate()
+    assert unique.bt_count() == unique.bt_count(workers=2) == 1
+    return True
+
+def test_stream():
+    """ the streaming solver should write the same lines as solve_all,
+    whatever the batch size, and read gzip input """
+    with open("puzzles/hard_puzzles_5.txt") as puzzles:
+        collection = SudokuCollection(puzzles)
+    expected = StringIO()
+    collection.solve_all(expected, verbose=False, engine="bitmask")
+    for batch_size in (1, 2, 1000):
+        with open("puzzles/hard_puzzles_5.txt") as puzzles:
+            out = StringIO()
+            assert solve_stream(puzzles, out, "bitmask", batch_size) == (5, 0)
+            assert out.getvalue() == expected.getvalue()
+    with tempfile.NamedTemporaryFile(suffix=".gz") as tmp:
+        with open("puzzles/hard_puzzles_5.txt") as puzzles:
+            gzfile = gzip.GzipFile(fileobj=tmp, mode="wb")
+            gzfile.write(puzzles.read())
+            gzfile.close()
+        tmp.flush()
+        out = StringIO()
+        solve_stream(open_puzzles(tmp.name), out, "dlx")
+        assert out.getvalue() == expected.getvalue()
+    assert all(len(line) == 81 and line.isdigit()
+        for line in expected.getvalue().splitlines())
+    with open("puzzles/16x16_puzzles_10.txt") as puzzles:
+        out = StringIO()
+        assert solve_stream(puzzles, out, "dlx") == (10, 0)
+    with open("puzzles/16x16_solutions_10.txt") as solutions:
+        assert out.getvalue().split() == solutions.read().split()
+    return True
+
+def test_batch():
+    """ the vectorized solver should agree with the per-puzzle engines and
+    flag inconsistent puzzles """
+    try:
+        import numpy
+    except ImportError:
+        print "NumPy is not installed, skipping the batch solver tests."
+        return True
+    from batch import solve_batch
+    with open("puzzles/euler_puzzles_50.txt") as puzzles:
+        collection = SudokuCollection(puzzles)
+    expected = [(sudoku.to_str(), True) for sudoku in collection
+        if sudoku.solve("bitmask")]
+    puzzles = [line.strip() for line in open("puzzles/euler_puzzles_50.txt")]
+    assert solve_batch(puzzles) == expected
+    assert solve_batch(puzzles, "dlx") == expected
+    collection = SudokuCollection(puzzles)
+    collection.solve_all(verbose=False, vectorized=True)
+    assert [(sudoku.to_str(), True) for sudoku in collection] == expected
+    bogus = "905079003200000000348000000050680000070204080000013020000000471000000006800790300"
+    assert not solve_batch([bogus, puzzles[0]])[0][1]
+    assert solve_batch([bogus, puzzles[0]])[1] == expected[0]
+    with open("puzzles/16x16_puzzles_10.txt") as puzzles:
+        big = SudokuCollection(puzzles)
+    try:
+        big.solve_all(verbose=False, vectorized=True)
+        assert False
+    except SudokuError:
+        pass
+    return True
+
+def test_cache():
+    """ puzzles from the same symmetry class should share one cache entry """
+    from canonical import canonicalize
+    from cache import SolutionCache
+    puzzle = "400000805030000000000700000020000060000080400000010000000603070500200000104000000"
+    # transpose, swap the first two bands and relabel 1 <-> 4
+    rows = [puzzle[row*9:row*9+9] for row in xrange(9)]
+    cols = ["".join(col) for col in zip(*rows)]
+    relabel = {"1": "4", "4": "1"}
+    twin = "".join(relabel.get(char, char) for char in "".join(cols[3:6] + cols[:3] + cols[6:]))
+    assert twin != puzzle and canonicalize(twin)[0] == canonicalize(puzzle)[0]
+    cache = SolutionCache(maxsize=2)
+    first = Sudoku(instr=puzzle)
+    assert first.solve("bitmask", cache)
+    second = Sudoku(instr=twin)
+    assert second.solve("bitmask", cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    expected = Sudoku(instr=twin)
+    expected.solve("bitmask")
+    assert second.to_str() == expected.to_str()
+    with open("puzzles/hard_puzzles_5.txt") as puzzles:
+        collection = SudokuCollection(puzzles)
+    collection.solve_all(verbose=False, engine="bitmask", workers=2, cache=cache)
+    assert cache.evictions == 3 and len(cache.entries) == 2
+    cachefile = tempfile.NamedTemporaryFile()
+    cache.save(cachefile.name)
+    assert SolutionCache(path=cachefile.name).entries == cache.entries
+    return True
+
+def test_memo():
+    """ the memo tables should stay bounded and count what they do """
+    from decorators import memoize, memoid, memotables, clear_all
+    calls = []
+    @memoize(maxsize=2)
+    def square(x):
+        calls.append(x)
+        return x*x
+    assert [square(x) for x in (1, 2, 1, 3, 2)] == [1, 4, 1, 9, 4]
+    assert calls == [1, 2, 3, 2] # 2 was evicted by 3
+    info = square.cache_info()
+    assert (info["hits"], info["misses"], info["evictions"], info["size"]) == (1, 4, 2, 2)
+    assert info["bytes"] > 0
+    before = len(calls)
+    assert square(x=2) == 4 and square(x=2) == 4 and len(calls) == before + 1
+    from canonical import canonicalize
+    with open("puzzles/hard_solutions_5.txt") as solutions:
+        solution = solutions.readline().strip()
+    assert canonicalize(solution, limit=10) is None # too symmetric for 10
+    @memoize(ttl=-1) # everything expires at once
+    def cube(x):
+        calls.append(x)
+        return x**3
+    cube(2); cube(2)
+    assert calls[-2:] == [2, 2]
+    @memoid
+    def length(lst):
+        return len(lst)
+    assert length([1, 2]) == 2
+    assert length([1, 2, 3]) == 3 # a new list, maybe on the same id
+    assert square.memo_table in memotables.values()
+    clear_all()
+    assert square.cache_info()["size"] == 0 and length.cache_info()["size"] == 0
+    assert Sudoku.char_to_cand_list("0") == tuple(range(1, 10))
+    return True
+
+def test_techniques():
+    """ every technique should keep the solutions and cut the search """
+    from techniques import TECHNIQUES, branches_saved
+    with open("puzzles/hard_puzzles_5.txt") as puzzles:
+        lines = [line.strip() for line in puzzles]
+    for line in lines:
+        plain = Sudoku(instr=line)
+        assert plain.solve("bitmask", techniques=())
+        for name in TECHNIQUES:
+            sudoku = Sudoku(instr=line)
+            assert sudoku.solve("bitmask", techniques=(name,))
+            assert sudoku.table == plain.table
+    saved, nodes = branches_saved(lines[0])
+    assert set(saved) == set(TECHNIQUES)
+    plain = BitBoard.from_str(lines[0])
+    plain.solve(techniques=())
+    assert nodes <= plain.nodes
+    board = BitBoard.from_str(lines[0])
+    board.solve(techniques=("x_wing", "naked_pairs"))
+    assert set(board.eliminations) == set(["x_wing", "naked_pairs"])
+    return True
+
+def test_stats():
+    """ the stats should add up and stay off unless asked for """
+    from stats import SolveStats
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][3:5] # these need backtracking
+    total = SolveStats(count=0)
+    for line in lines:
+        stats = SolveStats()
+        sudoku = Sudoku(instr=line)
+        assert sudoku.solve(stats=stats) and stats.solved
+        assert sudoku.stats is None
+        assert stats.puzzle == line and stats.iterations > 0
+        assert stats.calls["solve1"] > 0 and stats.eliminations["solve1"] > 0
+        assert stats.nodes > stats.dead_ends and stats.max_depth > 0
+        assert stats.times["total"] >= stats.times["search"] > 0
+        assert json.loads(stats.to_json())["nodes"] == stats.nodes
+        total.add(stats)
+    assert total.count == 2
+    stats = SolveStats()
+    Sudoku(instr=lines[0]).solve("bitmask", stats=stats)
+    assert stats.nodes > 0 and "naked_pairs" in stats.eliminations
+    collection = SudokuCollection(lines)
+    statsfile = StringIO()
+    collection.solve_all(verbose=False, stats=True, statsfile=statsfile)
+    assert collection.stats.nodes == total.nodes
+    assert len(statsfile.getvalue().splitlines()) == 2
+    try:
+        collection.solve_all(verbose=False, stats=True, workers=2)
+        assert False
+    except SudokuError:
+        pass
+    return True
+
+def test_change_counters():
+    """ the running counters should match a full scan of the table """
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][:8]
+    for line in lines:
+        sudoku = Sudoku(instr=line)
+        givens = sudoku.solved_cells
+        assert givens == 81 - line.count("0")
+        sudoku.repeat_until_stuck([sudoku.solve1, sudoku.solve2, sudoku.solve3])
+        lengths = [len(cell) for cell in sudoku.table.itervalues()]
+        assert sudoku.solved_cells == lengths.count(1)
+        assert sudoku.empty_cells == lengths.count(0) == 0
+        assert sudoku.changes == 9*81 - (9-1)*givens - sum(lengths)
+        changes = sudoku.changes
+        assert not sudoku.repeat_until_stuck(sudoku.solve1) or sudoku.is_solved()
+        assert sudoku.changes == changes # nothing left for solve1
+    return True
+
+def test_count_solutions():
+    """ every engine should count alike and stop at the limit """
+    from sudoku import INVALID, UNIQUE, MULTIPLE
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][:3]
+    ambiguous = lines[0][:40] + "0"*41
+    invalid = "11" + lines[0][2:]
+    for engine in ["classic"] + sorted(Sudoku.engines):
+        for line in lines:
+            sudoku = Sudoku(instr=line)
+            assert sudoku.count_solutions(None, engine) == 1
+            assert sudoku.has_unique_solution(engine)
+            assert sudoku.to_str() == line # counting doesn't solve
+        assert Sudoku(instr=ambiguous).count_solutions(10, engine) == 10
+        assert Sudoku(instr=invalid).count_solutions(engine=engine) == 0
+    collection = SudokuCollection([lines[0], invalid, ambiguous])
+    outfile = StringIO()
+    tags = collection.classify_all(outfile, verbose=False, engine="bitmask")
+    assert tags == [UNIQUE, INVALID, MULTIPLE]
+    assert collection.classify_all(verbose=False, workers=2) == tags
+    assert outfile.getvalue().splitlines()[1] == invalid + " " + INVALID
+    return True
+
+def test_generator():
+    """ generated puzzles should be unique and rated as asked """
+    import random
+    from generator import dig, generate_stream, random_grid, rate, variants
+    rng = random.Random(1)
+    grid = random_grid(rng)
+    assert Sudoku(instr=grid).is_solved()
+    puzzle = dig(grid, "easy", rng)
+    assert rate(puzzle)[0] == "easy"
+    for variant in variants(puzzle, 5, rng):
+        sudoku = Sudoku(instr=variant)
+        assert sudoku.has_unique_solution("bitmask")
+        assert rate(variant)[0] == "easy"
+    extreme = "000000902006400000009630410000091800070000000001006005000900003807002050040000280"
+    assert rate(extreme)[0] == "extreme" and rate("11" + extreme[2:])[0] is None
+    outfiles = StringIO(), StringIO()
+    assert generate_stream(outfiles[0], 12, seed=7, per_puzzle=3, batch_size=6) == 12
+    generate_stream(outfiles[1], 12, workers=2, seed=7, per_puzzle=3, batch_size=6)
+    assert outfiles[0].getvalue() == outfiles[1].getvalue()
+    assert len(set(outfiles[0].getvalue().split())) == 12
+    try: # with seed 1 the first grid makes no medium puzzle
+        generate_stream(StringIO(), 2, "medium", seed=1, attempts=1)
+        assert False
+    except SudokuError:
+        pass
+    return True
+
+def test_service():
+    """ the service should answer over HTTP and the Unix socket """
+    import os
+    import threading
+    import time
+    import urllib2
+    from service import (INVALID, TIMEOUT, ServiceBusy, SolverService,
+        http_client, make_server, unix_client)
+    with open("puzzles/euler_puzzles_50.txt") as puzzles:
+        lines = [line.strip() for line in puzzles if len(line.strip()) == 81][:10]
+    with open("puzzles/euler_solutions_50.txt") as solutions:
+        expected = [line.strip() for line in solutions][:10]
+    service = SolverService(batch_size=4)
+    service.start()
+    path = os.path.join(tempfile.mkdtemp(), "sudoku.sock")
+    servers = [make_server(service, 0), make_server(service, path=path)]
+    for server in servers:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    try:
+        url = "http://localhost:{!s}".format(servers[0].server_address[1])
+        assert http_client(lines, url) == expected
+        assert http_client(["123"], url) == [INVALID]
+        assert unix_client(lines[:3], path) == expected[:3]
+        assert service.solve(lines[:2], timeout=0) == [TIMEOUT]*2
+        metrics = json.loads(urllib2.urlopen(url + "/metrics").read())
+        assert metrics["puzzles"] == 16 and metrics["invalid"] == 1
+        assert metrics["timeouts"] == 2 and metrics["batches"] >= 3
+        with open("puzzles/hard_puzzles_95.txt") as puzzles:
+            slow = [line.strip() for line in puzzles][12] # ~0.4s for classic
+        classic = SolverService("classic")
+        classic.start()
+        try:
+            before = time.time()
+            assert classic.solve([slow], timeout=0.02) == [TIMEOUT]
+            assert classic.solve(lines[:2]) == expected[:2]
+            assert time.time() - before < 0.3 # the slow one was given up
+        finally:
+            classic.stop()
+        try:
+            SolverService(max_pending=1).solve(lines) # not started, never drains
+            assert False
+        except ServiceBusy:
+            pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        service.stop()
+    return True
+
+def test_budgets():
+    """ running out of the budget should be told apart from failing """
+    import time
+    from sudoku import BUDGET_EXCEEDED
+    from stats import SolveStats
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][:8]
+    for engine in ["classic"] + sorted(Sudoku.engines):
+        stats = SolveStats()
+        result = Sudoku(instr=lines[6]).solve(engine, stats=stats, max_nodes=2)
+        assert result is BUDGET_EXCEEDED and not result
+        assert stats.budget_exceeded == 1 and stats.nodes == 3 and not stats.solved
+        result = Sudoku(instr=lines[6]).solve(engine, deadline=time.time() - 1)
+        assert result is BUDGET_EXCEEDED
+        assert Sudoku(instr=lines[6]).solve(engine, max_nodes=10**6) is True
+    exceeded = {}
+    for policy in ("skip", "retry", "report"):
+        collection = SudokuCollection(lines)
+        collection.solve_all(verbose=False, max_nodes=3, on_budget=policy)
+        exceeded[policy] = collection.exceeded
+        assert all(sudoku.is_solved() for i, sudoku in enumerate(collection)
+            if i not in collection.exceeded)
+    assert exceeded["skip"] == exceeded["report"]
+    assert set(exceeded["retry"]) < set(exceeded["skip"])
+    try:
+        SudokuCollection(lines).solve_all(verbose=False, timeout=1, workers=2)
+        assert False
+    except SudokuError:
+        pass
+    return True
+
+def test_incremental():
+    """ following the hints should solve the puzzle """
+    from incremental import IncrementalBoard
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        line = [line.strip() for line in puzzles][6]
+    with open("puzzles/hard_solutions_95.txt") as solutions:
+        solution = [grid.strip() for grid in solutions][6]
+    board = IncrementalBoard(line)
+    seen = set()
+    while not board.is_solved():
+        hint = board.next_hint()
+        assert hint.technique not in ("mistake", "contradiction")
+        assert hint.digit in board.candidates(hint.cell)
+        seen.add(hint.technique)
+        board.place(hint.cell, hint.digit)
+        fresh = BitBoard(board.masks())
+        assert fresh.propagate() and board.propagated() == fresh.cells
+    assert board.to_str() == solution and board.next_hint() is None
+    assert set(["naked_single", "hidden_single", "search"]) <= seen
+    empty = line.index("0")
+    cell = divmod(empty, 9)
+    assert board.unplace(cell) == int(solution[empty])
+    assert board.candidates(cell) == (int(solution[empty]),)
+    assert board.next_hint() == (("naked_single", cell, int(solution[empty])))
+    wrong = [digit for digit in range(1, 10) if digit != int(solution[empty])]
+    board = IncrementalBoard(line)
+    board.place(cell, [d for d in board.candidates(cell) if d in wrong][0])
+    assert board.next_hint() == ("mistake", cell, int(solution[empty]))
+    for bad_move in (lambda: board.place(cell, 1), # not empty
+            lambda: board.place(divmod(line.index("0", empty+1), 9), 0),
+            lambda: board.unplace(divmod(line.index(line.strip("0")[0]), 9))): # a given
+        try:
+            bad_move()
+            assert False
+        except SudokuError:
+            pass
+    return True
+
+def test_big_boards():
+    """ 16x16 and 25x25 boards should be read, solved and written back """
+    with open("puzzles/16x16_puzzles_10.txt") as puzzles:
+        collection = SudokuCollection(puzzles)
+    with open("puzzles/16x16_solutions_10.txt") as solutions:
+        solution = solutions.readline().strip()
+    puzzle = collection[0].to_str()
+    assert len(collection) == 10 and len(puzzle) == 256
+    for engine in ("classic", "dlx"):
+        sudoku = Sudoku(instr=puzzle.lower())
+        assert sudoku.solve(engine) and sudoku.is_solved()
+        assert sudoku.to_str() == solution
+    assert Sudoku(instr=puzzle).count_solutions(engine="dlx") == 1
+    rows = [[set([int(symbol, 36)]) for symbol in solution[k:k+16]]
+        for k in xrange(0, 256, 16)]
+    assert Sudoku(inlist=rows).is_solved()
+    assert Sudoku.char_to_cand_list("G", 4) == (16,)
+    try:
+        Sudoku(instr=puzzle).solve("bitmask")
+        assert False
+    except SudokuError:
+        pass
+    from dlx import DancingLinks
+    assert DancingLinks.from_str(puzzle.lower()).solve()
+    for bad in ("A" + "0"*80, puzzle.replace("0", "H", 1)): # not symbols of the board
+        try:
+            DancingLinks.from_str(bad)
+            assert False
+        except ValueError:
+            pass
+    from cache import SolutionCache
+    for workers in (1, 2): # the cache only takes 9x9 puzzles
+        try:
+            SudokuCollection([puzzle]).solve_all(verbose=False, engine="dlx",
+                workers=workers, cache=SolutionCache())
+            assert False
+        except SudokuError:
+            pass
+    with open("puzzles/25x25_puzzles_5.txt") as puzzles:
+        puzzle = puzzles.readline().strip()
+    with open("puzzles/25x25_solutions_5.txt") as solutions:
+        solution = solutions.readline().strip()
+    sudoku = Sudoku(instr=puzzle)
+    assert sudoku.solve("dlx") and sudoku.to_str() == solution
+    return True
+
+def test_store():
+    """ the store should give random access to text and packed files """
+    import os
+    import pickle
+    import shutil
+    from store import PuzzleStore, pack
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "hard.txt")
+        shutil.copy("puzzles/hard_puzzles_95.txt", path)
+        with open(path) as puzzles:
+            lines = [line.strip() for line in puzzles]
+        with PuzzleStore(path) as store:
+            assert len(store) == 95 and os.path.exists(path + ".idx")
+            assert store[0] == lines[0] and store[-1] == lines[-1]
+            assert list(store[10:40:3][2:]) == lines[10:40:3][2:]
+            assert list(store[::-1][:5]) == lines[::-1][:5]
+            shards = store.shards(4)
+            assert sum((list(shard) for shard in shards), []) == lines
+            assert list(pickle.loads(pickle.dumps(shards[2]))) == list(shards[2])
+            with open(os.path.join(directory, "hard.sdk"), "wb") as outfile:
+                pack(store, outfile)
+        assert os.path.getsize(os.path.join(directory, "hard.sdk")) == 8 + 95*41
+        with PuzzleStore(os.path.join(directory, "hard.sdk")) as packed:
+            assert list(packed) == lines and packed[-3] == lines[-3]
+        for bad in ("1"*79, "a" + lines[0][1:]): # would shift the records after them
+            outfile = StringIO()
+            try:
+                pack([lines[0], bad], outfile)
+                assert False
+            except SudokuError:
+                assert outfile.getvalue() == ""
+        with open(path, "a") as outfile: # a stale index is rebuilt
+            outfile.write(lines[0] + "\n")
+        with PuzzleStore(path) as store:
+            assert len(store) == 96 and store[95] == lines[0]
+    finally:
+        shutil.rmtree(directory)
+    return True
+
+def test_verify():
+    """ the bundled solutions should pass, broken ones fail with a reason """
+    import verify
+    for name in ("euler_{!s}_50", "hard_{!s}_95", "hard_{!s}_5",
+            "16x16_{!s}_10", "25x25_{!s}_5"):
+        assert verify.verify_files("puzzles/" + name.format("solutions") + ".txt",
+            "puzzles/" + name.format("puzzles") + ".txt") == []
+    with open("puzzles/hard_solutions_5.txt") as solutions:
+        lines = [line.strip() for line in solutions]
+    with open("puzzles/hard_puzzles_5.txt") as puzzles:
+        clues = [line.strip() for line in puzzles]
+    clue = next(i for i, char in enumerate(clues[1]) if char != "0")
+    other = lines[1][clue+1 if clue % 9 < 8 else clue-1]
+    lines[1] = lines[1][:clue] + other + lines[1][clue+1:] # breaks a clue
+    free = next(i for i in xrange(80) if i % 9 < 8 and clues[2][i] == clues[2][i+1] == "0")
+    lines[2] = (lines[2][:free] + lines[2][free+1] + lines[2][free] +
+        lines[2][free+2:]) # breaks two columns
+    lines[3] = lines[3][:80] + "x"
+    expected = [(2, verify.CLUE), (3, verify.UNIT), (4, verify.MALFORMED),
+        (6, verify.MISSING)]
+    assert list(verify.verify_lines(lines[:4] + ["\n"], clues)) == expected
+    numpy = verify.np
+    verify.np = None # the pure Python checks
+    try:
+        assert list(verify.verify_lines(lines[:4] + ["\n"], clues)) == expected
+    finally:
+        verify.np = numpy
+    assert list(verify.verify_lines(lines + lines[:1], clues)) == expected[:3] + [(6, verify.EXTRA)]
+    return True
+
+def test_heuristics():
+    """ every branching heuristic should find the solutions, and the buckets
+    of open cells should follow the table """
+    from heuristics import CELL_SELECTORS, VALUE_ORDERS
+    with open("puzzles/hard_puzzles_95.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][3:7]
+    with open("puzzles/hard_solutions_95.txt") as solutions:
+        expected = [line.strip() for line in solutions][3:7]
+    for select in CELL_SELECTORS:
+        for order in VALUE_ORDERS:
+            for line, solution in zip(lines, expected):
+                sudoku = Sudoku(instr=line)
+                assert sudoku.solve(select=select, order=order)
+                assert sudoku.to_str() == solution
+                assert sudoku.heuristics == (select, order)
+    assert Sudoku(instr=lines[0]).count_solutions(select="unit", order="lcv") == 1
+    sudoku = Sudoku(instr=lines[1])
+    sudoku.propagate()
+    buckets = [set(bucket) for bucket in sudoku.buckets]
+    counters = (list(sudoku.open_counts), list(sudoku.placed))
+    sudoku.count_cells()
+    assert buckets == sudoku.buckets and any(buckets)
+    assert counters == (sudoku.open_counts, sudoku.placed) and any(counters[0])
+    try:
+        Sudoku(instr=lines[0]).solve(select="random")
+        assert False
+    except SudokuError:
+        pass
+    return True
+
+def test_checkpoint():
+    """ an interrupted run resumed from its checkpoint and the merged shards
+    of a run should write the same output as a single run """
+    import os
+    import shutil
+    from checkpoint import Checkpoint, merge_shards
+    directory = tempfile.mkdtemp()
+    path = lambda name: os.path.join(directory, name)
+    with open("puzzles/euler_puzzles_50.txt") as puzzles:
+        lines = [line.strip() for line in puzzles][:20]
+    with open(path("puzzles.txt"), "w") as puzzles:
+        puzzles.write("header\n" + "\n".join(lines) + "\n")
+    expected = StringIO()
+    with open(path("puzzles.txt")) as puzzles:
+        solve_stream(puzzles, expected, "bitmask")
+    class Crash(Exception):
+        pass
+    class CrashingFile(object):
+        """ a file that breaks down after its first 13 lines """
+        def __init__(self, name):
+            self.f = open(name)
+        def __iter__(self):
+            for number, line in enumerate(self.f):
+                if number == 13:
+                    raise Crash()
+                yield line
+    try:
+        with open(path("out.txt"), "a") as outfile:
+            try:
+                solve_stream(CrashingFile(path("puzzles.txt")), outfile, "bitmask",
+                    batch_size=5, checkpoint=path("out.ckpt"))
+                assert False
+            except Crash:
+                outfile.write("half a line") # written after the checkpoint
+        checkpoint = Checkpoint.load(path("out.ckpt"))
+        assert (checkpoint.completed, checkpoint.position) == (10, 10)
+        assert not checkpoint.finished
+        for run in range(2): # the second run finds the first one finished
+            with open(path("out.txt"), "a") as outfile:
+                with open(path("puzzles.txt")) as puzzles:
+                    assert solve_stream(puzzles, outfile, "bitmask", batch_size=5,
+                        checkpoint=path("out.ckpt")) == (20, 0)
+            with open(path("out.txt")) as outfile:
+                assert outfile.read() == expected.getvalue()
+        for number in range(3):
+            with open(path("shard{!s}".format(number)), "a") as outfile:
+                with open(path("puzzles.txt")) as puzzles:
+                    solve_stream(puzzles, outfile, "bitmask", batch_size=4,
+                        checkpoint=path("ckpt{!s}".format(number)), shard=(number, 3))
+        shards = [open(path("shard{!s}".format(number))) for number in range(3)]
+        merged = StringIO()
+        assert merge_shards(shards, merged) == 20
+        assert merged.getvalue() == expected.getvalue()
+        for shard in shards:
+            shard.close()
+        collection = SudokuCollection(lines)
+        class CrashingSudoku(Sudoku):
+            def solve(self, *args, **kwargs):
+                raise Crash()
+        collection.sudokus[8] = CrashingSudoku(instr=lines[8])
+        with open(path("all.txt"), "a") as outfile:
+            try:
+                collection.solve_all(outfile, verbose=False, engine="bitmask",
+                    checkpoint=path("all.ckpt"), checkpoint_every=3)
+                assert False
+            except Crash:
+                outfile.write("half a line")
+        checkpoint = Checkpoint.load(path("all.ckpt"))
+        assert (checkpoint.completed, checkpoint.position) == (6, 6)
+        bogus = "905079003200000000348000000050680000070204080000013020000000471000000006800790300"
+        collection = SudokuCollection(lines[:-1] + [bogus])
+        with open(path("all.txt"), "a") as outfile:
+            collection.solve_all(outfile, verbose=False, engine="bitmask",
+                checkpoint=path("all.ckpt"), checkpoint_every=3)
+        checkpoint = Checkpoint.load(path("all.ckpt"))
+        assert (checkpoint.completed, checkpoint.bogus, checkpoint.finished) == (20, 1, True)
+        with open(path("all.txt")) as outfile:
+            written = outfile.read().splitlines()
+        assert written[:-1] == expected.getvalue().splitlines()[:-1]
+        collection = SudokuCollection(lines)
+        for number in range(2):
+            with open(path("all{!s}".format(number)), "a") as outfile:
+                collection.solve_all(outfile, verbose=False, engine="bitmask",
+                    checkpoint=path("all{!s}.ckpt".format(number)),
+                    checkpoint_every=3, shard=(number, 2))
+        shards = [open(path("all{!s}".format(number))) for number in range(2)]
+        merged = StringIO()
+        assert merge_shards(shards, merged) == 20
+        assert merged.getvalue() == expected.getvalue()
+        for shard in shards:
+            shard.close()
+    finally:
+        shutil.rmtree(directory)
+    return True
+
 if __name__=="__main__":
     test_sudoku_class()
+    test_bitboard()
+    test_parallel()
+    test_parallel_branches()
+    test_stream()
+    test_batch()
+    test_cache()
+    test_memo()
+    test_techniques()
+    test_stats()
+    test_change_counters()
+    test_count_solutions()
+    test_generator()
+    test_service()
+    test_budgets()
+    test_incremental()
+    test_big_boards()
+    test_store()
+    test_verify()
+    test_heuristics()
+    test_checkpoint()
@@ -0,0 +1,230 @@
+#! /usr/bin/python
+
+#  Bulk verifier for solved grids and solution files
+#
+#  A solution is correct if every unit (Sudoku.regions: the boxes, rows and
+#  columns) holds every digit once and it keeps the clues of its puzzle. As
+#  a unit has exactly as many cells as there are digits, the first check
+#  is that the OR of the digit bits of the unit has every bit set.
+#
+#      ./verify.py puzzles/hard_solutions_95.txt --puzzles puzzles/hard_puzzles_95.txt
+#
+#  prints the line numbers of the solutions that fail and exits with
+#  status 1 if there are any. With NumPy the lines are checked in batches
+#  of whole arrays; without it, one by one.
+
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sudoku import BOARD_SIZES, SYMBOLS, Sudoku
+
+# why a line fails, in the order they are checked
+MALFORMED = "malformed" # not a full grid of the symbols of a board size
+CLUE = "clue"           # differs from a clue of the puzzle
+UNIT = "unit"           # a digit is missing from (twice in) a unit
+MISSING = "missing"     # there are more puzzles than solutions
+EXTRA = "extra"         # there are more solutions than puzzles
+
+BAD_SYMBOL = 255
+
+def _symbol_values():
+    """ the digit of every character code: 0 for an empty cell, BAD_SYMBOL
+    for a character that isn't a symbol """
+    values = [BAD_SYMBOL]*256
+    values[ord("0")] = values[ord(".")] = 0
+    for digit, symbol in enumerate(SYMBOLS, 1):
+        values[ord(symbol)] = values[ord(symbol.lower())] = digit
+    return values
+
+VALUES = _symbol_values()
+
+_units = {} # box size -> the units as lists of cell indices
+
+def units(size):
+    """ the units of the board with size x size boxes as lists of cell
+    indices (row*width+col), in the order of Sudoku.regions """
+    if size not in _units:
+        width = size*size
+        _units[size] = [sorted(row*width + col for row, col in region)
+            for region in Sudoku.geometry(size)["regions"]]
+    return _units[size]
+
+def check(solution, puzzle=None):
+    """ None if solution (a string) is a solved grid that keeps the clues
+    of puzzle (if given), otherwise the reason it fails """
+    size = BOARD_SIZES.get(len(solution))
+    if size is None:
+        return MALFORMED
+    width = size*size
+    values = [VALUES[ord(char)] for char in solution]
+    if not all(0 < value <= width for value in values):
+        return MALFORMED
+    if puzzle is not None:
+        if len(puzzle) != len(solution):
+            return MALFORMED
+        for char, value in zip(puzzle, values):
+            clue = VALUES[ord(char)]
+            if clue and clue != value:
+                return CLUE
+    bits = [1 << (value-1) for value in values]
+    full = (1 << width) - 1
+    for unit in units(size):
+        used = 0
+        for i in unit:
+            used |= bits[i]
+        if used != full:
+            return UNIT
+    return None
+
+_symbol_array = None
+
+def check_batch(solutions, puzzles=None):
+    """ check() of a list of solutions of the same board size (and of the
+    list of their puzzles, if given) at once with NumPy. Returns the
+    (index, reason) pairs of the solutions that fail. """
+    global _symbol_array
+    if _symbol_array is None:
+        _symbol_array = np.array(VALUES, dtype=np.uint8)
+    size = BOARD_SIZES[len(solutions[0])]
+    cells, width = size**4, size*size
+    values = _symbol_array[np.frombuffer("".join(solutions), dtype=np.uint8)]
+    values = values.reshape(-1, cells)
+    bad = (values == 0) | (values > width)
+    malformed = bad.any(axis=1)
+    # the bit of every digit, 0 for bad cells (their grid is malformed)
+    dtype = np.uint16 if width < 16 else np.uint32 # 1 << width has to fit
+    bits = np.left_shift(dtype(1), np.where(bad, 0, values).astype(dtype)) >> 1
+    # the units of Sudoku.regions as axes of the grid: the cell (row, col)
+    # is at (row // size, row % size, col // size, col % size)
+    grid = bits.reshape(-1, size, size, size, size)
+    full = (1 << width) - 1
+    wrong = malformed.copy()
+    for axes in ((2, 4), (3, 4), (1, 2)): # boxes, rows, columns
+        used = np.bitwise_or.reduce(grid, axis=axes)
+        wrong |= (used != full).any(axis=2).any(axis=1)
+    wrong_clue = None
+    if puzzles is not None:
+        clues = _symbol_array[np.frombuffer("".join(puzzles), dtype=np.uint8)]
+        clues = clues.reshape(-1, cells)
+        wrong_clue = ((clues != 0) & (clues != values)).any(axis=1)
+        wrong |= wrong_clue
+    return [(i, MALFORMED if malformed[i] else
+        CLUE if wrong_clue is not None and wrong_clue[i] else UNIT)
+        for i in np.flatnonzero(wrong).tolist()]
+
+def _check_lines(solutions, puzzles):
+    """ the failing (index, reason) pairs of a batch of solution (and
+    puzzle) strings: lines of the same size go through check_batch()
+    together, if there is NumPy """
+    if np is None:
+        if puzzles is None:
+            puzzles = [None]*len(solutions)
+        reasons = map(check, solutions, puzzles)
+        return [(i, reason) for i, reason in enumerate(reasons) if reason is not None]
+    lengths = set(map(len, solutions))
+    if puzzles is not None:
+        lengths.update(map(len, puzzles))
+    if len(lengths) == 1 and lengths <= set(BOARD_SIZES):
+        return check_batch(solutions, puzzles) # the usual case
+    failures = []
+    groups = {} # number of cells -> indices of the lines
+    for i, solution in enumerate(solutions):
+        if len(solution) in BOARD_SIZES and (puzzles is None
+                or len(puzzles[i]) == len(solution)):
+            groups.setdefault(len(solution), []).append(i)
+        else:
+            failures.append((i, MALFORMED))
+    for indices in groups.itervalues():
+        failures.extend((indices[i], reason) for i, reason in
+            check_batch([solutions[i] for i in indices],
+                None if puzzles is None else [puzzles[i] for i in indices]))
+    return sorted(failures)
+
+def _read_puzzles(lines, count):
+    """ the next count puzzles of an iterator of lines, the lines that are
+    not puzzles skipped """
+    puzzles = []
+    while len(puzzles) < count:
+        chunk = [line.strip() for line in islice(lines, count - len(puzzles))]
+        if not chunk:
+            break
+        if not set(map(len, chunk)) <= set(BOARD_SIZES):
+            chunk = [line for line in chunk if len(line) in BOARD_SIZES]
+        puzzles.extend(chunk)
+    return puzzles
+
+def verify_lines(solutions, puzzles=None, batch_size=65536):
+    """ Checks every non empty line of solutions (an iterable of lines, like
+    a file) and yields the (1 based line number, reason) of every line
+    that fails. If puzzles (another iterable of lines) is given, the n-th
+    solution is checked against its n-th puzzle (a line of 81, 256 or 625
+    characters, just like SudokuCollection reads them), and the lines left
+    over in either of them fail as EXTRA or MISSING. """
+    solutions = iter(solutions)
+    if puzzles is not None:
+        puzzles = iter(puzzles)
+    first = 1 # line number of the first line of the batch
+    while True:
+        lines = [line.strip() for line in islice(solutions, batch_size)]
+        if not lines:
+            break
+        numbers = range(first, first + len(lines))
+        first += len(lines)
+        if not all(lines):
+            numbers = [number for number, line in zip(numbers, lines) if line]
+            lines = filter(None, lines)
+        batch_puzzles = None
+        extra = []
+        if puzzles is not None:
+            batch_puzzles = _read_puzzles(puzzles, len(lines))
+            extra = numbers[len(batch_puzzles):]
+            del lines[len(batch_puzzles):]
+        if lines:
+            for i, reason in _check_lines(lines, batch_puzzles):
+                yield numbers[i], reason
+        for number in extra:
+            yield number, EXTRA
+    if puzzles is not None:
+        while True:
+            left = _read_puzzles(puzzles, batch_size)
+            if not left:
+                break
+            for number in xrange(first, first + len(left)):
+                yield number, MISSING
+            first += len(left)
+
+def verify_files(solutions_path, puzzles_path=None, batch_size=65536):
+    """ The list of the failing (line number, reason) pairs of a solution
+    file (see verify_lines()). Both files can be .gz or - for stdin. """
+    from stream import open_puzzles
+    solutions = open_puzzles(solutions_path)
+    puzzles = open_puzzles(puzzles_path) if puzzles_path else None
+    try:
+        return list(verify_lines(solutions, puzzles, batch_size))
+    finally:
+        for f in (solutions, puzzles):
+            if f and f.name != "<stdin>":
+                f.close()
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+    parser = argparse.ArgumentParser(description="Sudoku solution verifier")
+    parser.add_argument("solutions", help="file with one solution per line "
+        "(- reads stdin, .gz files are decompressed)")
+    parser.add_argument("--puzzles", help="the puzzles of the solutions, one "
+        "per line in the same order")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    args = parser.parse_args()
+    before = time.time()
+    failures = verify_files(args.solutions, args.puzzles, args.batch_size)
+    for number, reason in failures:
+        print "line {!s}: {!s}".format(number, reason)
+    sys.stderr.write("{!s} failing lines, {:.2f} secs\n".format(
+        len(failures), time.time() - before))
+    sys.exit(1 if failures else 0)